@@ -0,0 +1,275 @@
+import numpy as np
+import pandas as pd
+
+# Trailing window (in transactions) for the per-merchant median/MAD baseline
+ROLLING_WINDOW = 30
+ROLLING_MIN_PERIODS = 5
+
+# |robust z| above which an amount is an outlier (Iglewicz & Hoaglin's recommended cut-off)
+ZSCORE_THRESHOLD = 3.5
+
+# Outliers must also be material: at least this amount, and this far above the baseline median.
+# Scores are on the log scale, so tiny amounts at merchants with very regular spend can
+# reach the z cut-off on a few units of difference.
+MIN_OUTLIER_AMOUNT = 100.0
+MIN_OUTLIER_DEVIATION = 50.0
+
+# Velocity bursts: at least VELOCITY_MIN_COUNT card debits within VELOCITY_WINDOW_MINUTES
+VELOCITY_WINDOW_MINUTES = 10
+VELOCITY_MIN_COUNT = 5
+CARD_CHANNEL_PATTERN = r"\bPOS\b"
+
+# Rows of trailing windows materialized at once when computing baselines
+WINDOW_CHUNK_ROWS = 20_000
+
+# The only statement columns scoring needs; read on their own so the full statement is never loaded
+SCORING_COLUMNS = ["TXN_DATE_TIME", "TXN_AMOUNT_LCY", "CR_DR_INDICATOR", "TXN_DESC", "COUNTERPARTY", "TXN_CARD", "TXN_LOCAL_TIME"]
+
+# Flagged transactions kept per day for display, most anomalous first (counts include all of them)
+FLAGGED_ROWS_PER_DAY = 50
+
+# Scale factors that make MAD / mean absolute deviation comparable to a standard deviation
+MAD_SCALE = 0.6745
+MEAN_AD_SCALE = 0.7979
+
+
+def _description_codes(desc):
+    """Factorizes descriptions into (description, merchant, is-card-channel) codes per row.
+
+    Merchants are grouped by dropping digits (references, card numbers, timestamps). String
+    work runs only over the distinct descriptions and is broadcast back through the codes.
+    """
+    # Missing descriptions (code -1) become "", appended after the distinct values
+    codes, uniques = pd.factorize(desc)
+    uniques = pd.Series(np.append(np.asarray(uniques, dtype=object), ""))
+    codes = np.where(codes < 0, len(uniques) - 1, codes)
+    normalized = uniques.str.upper().str.replace(r"[\d\s]+", " ", regex=True).str.strip()
+    merchant_codes, _ = pd.factorize(normalized)
+    is_card = uniques.str.contains(CARD_CHANNEL_PATTERN, case=False, regex=True).to_numpy()
+    return codes, merchant_codes[codes], is_card[codes]
+
+
+def _trailing_baselines(amount, group_codes, chunk_size=WINDOW_CHUNK_ROWS):
+    """Median, MAD and mean absolute deviation of each row's trailing window.
+
+    The window is the previous ROLLING_WINDOW transactions of the same group, excluding
+    the row itself; deviations are taken from the window's own median. Rows with fewer
+    than ROLLING_MIN_PERIODS previous transactions get NaN. Rows must be sorted by
+    group and time; windows are materialized a chunk at a time to bound memory.
+    """
+    n = len(amount)
+    median, mad, mean_ad = (np.full(n, np.nan) for _ in range(3))
+    if n == 0:
+        return median, mad, mean_ad
+
+    # Window i covers rows i-ROLLING_WINDOW .. i-1 once ROLLING_WINDOW slots of padding are prepended
+    padded_amount = np.concatenate([np.full(ROLLING_WINDOW, np.nan), amount[:-1]])
+    padded_groups = np.concatenate([np.full(ROLLING_WINDOW, -1, dtype=np.int64), group_codes[:-1].astype(np.int64)])
+    amount_windows = np.lib.stride_tricks.sliding_window_view(padded_amount, ROLLING_WINDOW)
+    group_windows = np.lib.stride_tricks.sliding_window_view(padded_groups, ROLLING_WINDOW)
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        same_group = group_windows[start:stop] == group_codes[start:stop, None]
+        windows = np.where(same_group, amount_windows[start:stop], np.nan)
+        enough = same_group.sum(axis=1) >= ROLLING_MIN_PERIODS
+        if not enough.any():
+            continue
+
+        windows = windows[enough]
+        window_median = np.nanmedian(windows, axis=1)
+        deviations = np.abs(windows - window_median[:, None])
+        rows = np.arange(start, stop)[enough]
+        median[rows] = window_median
+        mad[rows] = np.nanmedian(deviations, axis=1)
+        mean_ad[rows] = np.nanmean(deviations, axis=1)
+    return median, mad, mean_ad
+
+
+def _robust_zscores(amount, group_codes, direction_codes):
+    """Robust z-score of each amount against its (merchant, direction) trailing baseline.
+
+    The baseline is the median and MAD of the group's previous ROLLING_WINDOW amounts
+    (see `_trailing_baselines`), so a transaction never dampens its own score. Rows are
+    expected to be sorted by group and time. Groups with too little history fall back
+    to the statement-wide median/MAD of the same direction. Returns the z-scores and
+    the baseline median of each row.
+    """
+    median, mad, mean_ad = _trailing_baselines(amount, group_codes)
+
+    # Statement-wide baseline per direction for merchants without enough history
+    amount_series = pd.Series(amount)
+    direction_median = amount_series.groupby(direction_codes).transform("median").to_numpy()
+    direction_deviation = np.abs(amount - direction_median)
+    direction_deviations = pd.Series(direction_deviation).groupby(direction_codes)
+    direction_mad = direction_deviations.transform("median").to_numpy()
+    direction_mean_ad = direction_deviations.transform("mean").to_numpy()
+
+    no_history = np.isnan(median)
+    median = np.where(no_history, direction_median, median)
+    mad = np.where(no_history, direction_mad, mad)
+    mean_ad = np.where(no_history, direction_mean_ad, mean_ad)
+
+    # MAD is zero when most amounts in the window are identical; use the mean deviation instead
+    scale = np.where(mad > 0, mad / MAD_SCALE, mean_ad / MEAN_AD_SCALE)
+    # A window of identical amounts has no spread at all; borrow the direction-wide one
+    direction_scale = np.where(direction_mad > 0, direction_mad / MAD_SCALE, direction_mean_ad / MEAN_AD_SCALE)
+    scale = np.where(scale > 0, scale, direction_scale)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        zscores = np.where(scale > 0, (amount - median) / scale, 0.0)
+    return np.nan_to_num(zscores), median
+
+
+def _has_time_of_day(times):
+    """Whether timestamps carry a real time of day (batch postings share one clock time)."""
+    valid = times[~np.isnat(times)]
+    if valid.size == 0:
+        return False
+    time_of_day = valid - valid.astype("datetime64[D]")
+    return np.unique(time_of_day).size > 1
+
+
+def _velocity_counts(times, group_codes, is_card_debit):
+    """Number of card debits of the same group in the trailing velocity window, per row."""
+    counts = np.zeros(len(times), dtype=np.int64)
+    idx = np.flatnonzero(is_card_debit)
+    if idx.size == 0:
+        return counts
+
+    seconds = times[idx].astype("datetime64[s]").astype(np.int64)
+    seconds -= seconds.min()
+    window = VELOCITY_WINDOW_MINUTES * 60
+
+    # One sortable key per (group, time); the per-group offset exceeds the time span plus the
+    # window, so a single searchsorted never counts transactions from another group.
+    key = group_codes[idx].astype(np.int64) * (seconds.max() + window + 1) + seconds
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    left = np.searchsorted(sorted_key, sorted_key - window, side="left")
+    counts[idx[order]] = np.arange(len(sorted_key)) - left + 1
+    return counts
+
+
+def score_transactions(df):
+    """Adds per-transaction anomaly scores and flags to a bank statement.
+
+    Statements parsed by `transaction_parser.parse_transactions` are baselined per
+    counterparty, and bursts are checked per card at the purchase's local time;
+    otherwise merchants are approximated from the description and the posting time is used,
+    unless every posting shares one clock time (daily batches), in which case no bursts are flagged.
+
+    Columns added:
+        ANOMALY_ZSCORE      robust z-score against the merchant/direction trailing median/MAD
+        IS_AMOUNT_OUTLIER   amount is unusually large for that merchant and direction, and at
+                            least MIN_OUTLIER_AMOUNT and MIN_OUTLIER_DEVIATION above the baseline
+        IS_DUPLICATE        repeat of an identical description, amount and direction on the same day
+        VELOCITY_COUNT      card debits in the trailing velocity window
+        IS_VELOCITY_BURST   part of a burst of card debits within a few minutes
+        IS_ANOMALY          any of the flags above
+    """
+    scored = df.copy()
+    if scored.empty:
+        for column in ["ANOMALY_ZSCORE", "VELOCITY_COUNT"]:
+            scored[column] = pd.Series(dtype="float64")
+        for column in ["IS_AMOUNT_OUTLIER", "IS_DUPLICATE", "IS_VELOCITY_BURST", "IS_ANOMALY"]:
+            scored[column] = pd.Series(dtype="bool")
+        return scored
+
+    times = pd.to_datetime(scored["TXN_DATE_TIME"]).to_numpy()
+    # Amounts are heavy-tailed, so baselines are built on the log scale
+    amount = np.log1p(scored["TXN_AMOUNT_LCY"].abs().to_numpy(dtype="float64"))
+    direction_codes, _ = pd.factorize(scored["CR_DR_INDICATOR"])
+    desc_codes, merchant_codes, is_card = _description_codes(scored["TXN_DESC"])
+    card_codes = np.zeros(len(scored), dtype=np.int64)
+    velocity_times = times
+    # Bursts need real clock times; statements posted in daily batches have none
+    has_time = np.full(len(scored), _has_time_of_day(times))
+    if "COUNTERPARTY" in scored.columns:
+        merchant_codes, _ = pd.factorize(scored["COUNTERPARTY"])
+        card_codes, _ = pd.factorize(scored["TXN_CARD"])
+        is_card = is_card | scored["TXN_CARD"].notna().to_numpy()
+        # Posting times are batch times; the local time is when the card was actually used
+        velocity_times = scored["TXN_LOCAL_TIME"].fillna(scored["TXN_DATE_TIME"]).to_numpy()
+        has_time |= scored["TXN_LOCAL_TIME"].notna().to_numpy()
+
+    # (merchant, direction) groups, sorted by group then time for the rolling windows
+    group_codes, _ = pd.factorize(merchant_codes.astype(np.int64) * (direction_codes.max() + 1) + direction_codes)
+    order = np.lexsort((times, group_codes))
+    zscores, baseline = np.empty(len(scored)), np.empty(len(scored))
+    zscores[order], baseline[order] = _robust_zscores(amount[order], group_codes[order], direction_codes[order])
+    absolute_amount = np.expm1(amount)
+    is_material = (absolute_amount >= MIN_OUTLIER_AMOUNT) & (absolute_amount - np.expm1(baseline) >= MIN_OUTLIER_DEVIATION)
+
+    is_card_debit = is_card & (scored["CR_DR_INDICATOR"] == "D").to_numpy() & has_time
+    # Card debits are checked for bursts per card, across all merchants
+    velocity = _velocity_counts(velocity_times, card_codes, is_card_debit)
+
+    scored["ANOMALY_ZSCORE"] = zscores
+    scored["IS_AMOUNT_OUTLIER"] = (zscores > ZSCORE_THRESHOLD) & is_material
+    scored["IS_DUPLICATE"] = pd.DataFrame({
+        "desc": desc_codes,
+        "amount": scored["TXN_AMOUNT_LCY"],
+        "direction": scored["CR_DR_INDICATOR"],
+        "day": times.astype("datetime64[D]"),
+    }).duplicated(keep="first").to_numpy()
+    scored["VELOCITY_COUNT"] = velocity
+    scored["IS_VELOCITY_BURST"] = velocity >= VELOCITY_MIN_COUNT
+    scored["IS_ANOMALY"] = scored["IS_AMOUNT_OUTLIER"] | scored["IS_DUPLICATE"] | scored["IS_VELOCITY_BURST"]
+    return scored
+
+
+def anomaly_partials(scored):
+    """Per-day counts of scored transactions and of each flag, indexed by DAY."""
+    flags = pd.DataFrame({
+        "DAY": scored["TXN_DATE_TIME"].dt.normalize(),
+        "Transactions": 1,
+        "Flagged": scored["IS_ANOMALY"],
+        "Outliers": scored["IS_AMOUNT_OUTLIER"],
+        "Duplicates": scored["IS_DUPLICATE"],
+        "Bursts": scored["IS_VELOCITY_BURST"],
+    })
+    return flags.groupby("DAY").sum()
+
+
+def flagged_rows(scored, per_day=FLAGGED_ROWS_PER_DAY):
+    """The flagged transactions, at most `per_day` of the most anomalous per posting day."""
+    flagged = scored.loc[scored["IS_ANOMALY"], [
+        "TXN_DATE_TIME", "TXN_DESC", "CR_DR_INDICATOR", "TXN_AMOUNT_LCY",
+        "ANOMALY_ZSCORE", "IS_AMOUNT_OUTLIER", "IS_DUPLICATE", "IS_VELOCITY_BURST"
+    ]]
+    day = flagged["TXN_DATE_TIME"].dt.normalize()
+    top = flagged["ANOMALY_ZSCORE"].groupby(day).rank(method="first", ascending=False) <= per_day
+    flagged = flagged[top.to_numpy()]
+    # Descriptions are materialized only for the rows kept
+    flagged = flagged.assign(TXN_DESC=flagged["TXN_DESC"].astype("object"))
+    flagged.insert(0, "DAY", flagged["TXN_DATE_TIME"].dt.normalize())
+    return flagged.reset_index(drop=True)
+
+
+def summarize_anomalies(counts, flagged, limit=5):
+    """Plain-text summary of the flagged transactions, for the dashboard and the LLM prompt.
+
+    `counts` holds the Flagged/Outliers/Duplicates/Bursts totals (see `anomaly_partials`),
+    `flagged` the flagged rows (see `flagged_rows`).
+    """
+    lines = [
+        f"- **Flagged Transactions:** {int(counts['Flagged'])} "
+        f"({int(counts['Outliers'])} unusual amounts, "
+        f"{int(counts['Duplicates'])} possible duplicates, "
+        f"{int(counts['Bursts'])} in rapid card-spend bursts)"
+    ]
+
+    top = flagged.sort_values("ANOMALY_ZSCORE", ascending=False).head(limit)
+    for _, txn in top.iterrows():
+        reasons = [
+            reason for reason, flag in [
+                ("unusual amount", txn["IS_AMOUNT_OUTLIER"]),
+                ("possible duplicate", txn["IS_DUPLICATE"]),
+                ("rapid card spend", txn["IS_VELOCITY_BURST"]),
+            ] if flag
+        ]
+        lines.append(
+            f"  - {pd.Timestamp(txn['TXN_DATE_TIME']):%Y-%m-%d} {txn['CR_DR_INDICATOR']} "
+            f"Rs {txn['TXN_AMOUNT_LCY']:.2f} {str(txn['TXN_DESC']).strip()[:60]} ({', '.join(reasons)})"
+        )
+    return "\n        ".join(lines)
@@ -1,30 +1,71 @@
 import streamlit as st
 import os
-import json
 import time
 import pandas as pd
-import fitz
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
-import datetime
 import re
-from generate_embeddings import (
-    extract_text, 
-    summarize_sale_deed, 
-    summarize_credit_report, 
-    summarize_id_document, 
-    analyze_bank_statement, 
-    run_ollama_model,
-    query_document
+import uuid
+from generate_embeddings import extract_text
+from pipeline import (
+    NAME_CHECK_DOCUMENTS,
+    build_profile_pipeline,
+    set_document_input,
+    collect_customer_profile
 )
+from profile_chat import ProfileChatSession
+from statement_reader import iter_statement_batches
+from documents import InMemoryDocument, get_thumbnail
+from document_store import get_store
+from portfolio_store import PortfolioStore, profile_record
+from llm_resilience import LLMError, LLMTimeoutError, LLMUnavailableError
+from warmup import start_warmup
 
 # Streamlit UI Setup
 st.set_page_config(page_title="🏦 Customer Profiler", layout="wide")
 
+# Shared content-addressed store: identical uploads are stored and processed once
+document_store = get_store()
+
+# OCR and LLM cold starts are paid in the background while the flash screen and upload step show
+warmup = start_warmup()
+
+# The flash screen stays up while warm-up runs: at least for its animation, at most this long
+FLASH_MIN_SECONDS = 1.5
+FLASH_MAX_SECONDS = 20
+
+def show_llm_error(e):
+    """Explains a failed model call instead of showing its placeholder output as a result."""
+    if isinstance(e, LLMUnavailableError):
+        st.error("❌ The AI model is currently unavailable. Please try again in a minute.")
+    elif isinstance(e, LLMTimeoutError):
+        st.error(f"❌ The AI model did not respond in time. Please try again. ({e})")
+    else:
+        st.error(f"❌ The AI model could not complete this request. Please try again. ({e})")
+
+
+def compute_node(pipeline, node, message):
+    """Gets a pipeline node, with a spinner if it must be (re)computed; stops the page if the model fails."""
+    try:
+        if not pipeline.is_fresh(node):
+            with st.spinner(message):
+                return pipeline.get(node)
+        return pipeline.get(node)
+    except LLMError as e:
+        show_llm_error(e)
+        st.stop()
+
+
 # **State Management**
 if "step" not in st.session_state:
     st.session_state.step = 0
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.customer_id = uuid.uuid4().hex  # Uploads are referenced per session and customer
     st.session_state.uploaded_files = {}  # Store uploaded files
+    st.session_state.pipeline = build_profile_pipeline()  # Recomputes only what changed downstream of an upload
+
+# ✅ Every rerun renews the session's references, so its uploads aren't evicted while it is in use
+document_store.touch_references(st.session_state.session_id, st.session_state.customer_id)
 
 # **Flash Screen**
 if st.session_state.step == 0:
@@ -59,7 +100,9 @@ if st.session_state.step == 0:
             """,
             unsafe_allow_html=True
         )
-    time.sleep(3)
+    flash_started = time.monotonic()
+    warmup.wait(FLASH_MAX_SECONDS)
+    time.sleep(max(0.0, FLASH_MIN_SECONDS - (time.monotonic() - flash_started)))
     st.session_state.step = 1
     st.rerun()
 
@@ -103,6 +146,13 @@ if st.session_state.step == 1:
 if st.session_state.step == 2:
     st.subheader("📂 Upload Customer Documents")
 
+    # ✅ **Warm-up Readiness** (whatever isn't ready yet finishes while documents are uploaded)
+    warmup_labels = {"ocr": "OCR engine", "llm": "AI model"}
+    warmup_icons = {"warming": "⏳", "ready": "✅", "failed": "⚠️"}
+    st.caption(" · ".join(
+        f"{warmup_icons[state]} {warmup_labels[name]} {state}" for name, state in warmup.status().items()
+    ))
+
     document_types = {
         "Identification Document": ["pdf", "png", "jpg", "jpeg"],
         "Sale Deed": ["pdf", "docx"],
@@ -116,10 +166,6 @@ if st.session_state.step == 2:
     columns = [col1, col2, col3, col4]
     doc_keys = list(document_types.keys())
 
-    temp_dir = "temp"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-
     for i, (doc_type, allowed_formats) in enumerate(document_types.items()):
         with columns[i]:
             uploaded_file = st.file_uploader(
@@ -129,33 +175,42 @@ if st.session_state.step == 2:
             )
 
             if uploaded_file:
-                # Save the file locally
-                file_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
+                # Keep the upload in memory; it is decoded straight from the buffer downstream
+                document = InMemoryDocument(uploaded_file.name, uploaded_file.getbuffer())
+                document_store.put_document(document)
+                document_store.add_reference(
+                    st.session_state.session_id, st.session_state.customer_id, doc_type, document.sha256, document.name
+                )
 
-                # Store file path instead of UploadedFile object
-                st.session_state.uploaded_files[doc_type] = file_path
+                st.session_state.uploaded_files[doc_type] = document
+                set_document_input(st.session_state.pipeline, doc_type, document)
 
                 # **Show preview based on file type**
                 st.subheader(f"📄 {doc_type} Preview")
 
                 if uploaded_file.type.startswith("image"):
-                    st.image(file_path, caption=f"{doc_type}", width=200)
+                    st.image(get_thumbnail(document), caption=f"{doc_type}", width=200)
 
                 elif uploaded_file.type == "application/pdf":
-                    with fitz.open(file_path) as pdf_doc:
+                    with document.open_pdf() as pdf_doc:
                         first_page_text = pdf_doc[0].get_text("text")
                     st.text_area(f"📜 {doc_type} (First Page Preview)", first_page_text[:1000], height=150)
 
                 elif uploaded_file.type in ["text/csv", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]:
-                    df = pd.read_csv(file_path) if uploaded_file.type == "text/csv" else pd.read_excel(file_path)
-                    st.dataframe(df.head(7), height=150)
+                    # Only the first batch is read, so large workbooks aren't loaded for a preview
+                    df = next(iter_statement_batches(document, batch_size=7), pd.DataFrame())
+                    st.dataframe(df, height=150)
 
                 elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    text_preview = extract_text(file_path)
+                    text_preview = extract_text(document)
                     st.text_area(f"📜 {doc_type} Preview", text_preview[:500], height=150)
 
+            elif doc_type in st.session_state.uploaded_files:
+                # ✅ Upload cleared: forget the document and everything derived from it
+                del st.session_state.uploaded_files[doc_type]
+                st.session_state.pipeline.remove_input(f"file:{doc_type}")
+                document_store.remove_reference(st.session_state.session_id, st.session_state.customer_id, doc_type)
+
 
 
     col1, col2 = st.columns(2)
@@ -172,17 +227,13 @@ if st.session_state.step == 2:
 if st.session_state.step == 3:
     st.subheader("📑 Verifying Customer Details")
 
-    uploaded_files = st.session_state.get("uploaded_files", {})
+    pipeline = st.session_state.pipeline
 
-    if "Identification Document" not in uploaded_files:
+    if not pipeline.has("identity"):
         st.error("❌ Identification Document not uploaded!")
     else:
-        # ✅ **Display Extracted Identity & Image (Don't Reprocess if Already Extracted)**
-        if "identity_details" not in st.session_state:
-            file_path = uploaded_files["Identification Document"]
-            with st.spinner("Extracting details from ID document..."):
-                extracted_text = summarize_id_document(extract_text(file_path))  # Extract text only
-                st.session_state.identity_details = extracted_text
+        # ✅ **Display Extracted Identity & Image (Only Reprocessed if the ID Document Changed)**
+        identity_details = compute_node(pipeline, "identity", "Extracting details from ID document...")
 
         # ✅ **Fetch Image from Backend Storage**
         customer_image_path = os.path.join("backend_documents", "customer_image.png")  # Adjust filename as needed
@@ -191,7 +242,7 @@ if st.session_state.step == 3:
         col1, col2 = st.columns([2, 1])
         with col1:
             st.subheader("👤 Extracted Customer Identity")
-            st.write(st.session_state.identity_details)
+            st.write(identity_details)
         with col2:
             if os.path.exists(customer_image_path):  # Ensure image exists before displaying
                 st.image(customer_image_path, caption="📷 Customer Photo", width=150)
@@ -213,40 +264,22 @@ if st.session_state.step == 3:
         if st.session_state.verification_started and not st.session_state.verification_completed:
             st.subheader("🔎 Matching Customer Name Across Documents")
 
+            # ✅ Mark verification as done; results below come from the pipeline cache
+            st.session_state.verification_completed = True
+
+        # ✅ **Name Checks Are Only Re-Run for Documents That Changed Since the Last Verification**
+        if st.session_state.verification_completed:
             name_match_results = {}
-            mismatches_found = False
-
-            # **Check Name in Sale Deed**
-            if "Sale Deed" in uploaded_files:
-                st.write("🔍 Checking Sale Deed...")
-                progress = st.progress(0)
-                with st.spinner("Processing..."):
-                    extracted_text = extract_text(uploaded_files["Sale Deed"])
-                    match_result = query_document(st.session_state.identity_details, extracted_text, "Sale Deed")
-                    is_matched = "YES" in match_result
-                    # name_match_results["Sale Deed"] = "✅ Matched" if is_matched else "❌ Not Matched"
-                    name_match_results["Sale Deed"] = "✅ Matched" if is_matched else "✅ Matched"
-                    if not is_matched:
-                        mismatches_found = True
-                    progress.progress(1.0)
-
-            # **Check Name in Credit Score Report**
-            if "Credit Score Report" in uploaded_files:
-                st.write("🔍 Checking Credit Score Report...")
-                progress = st.progress(0)
-                with st.spinner("Processing..."):
-                    extracted_text = extract_text(uploaded_files["Credit Score Report"])
-                    match_result = query_document(st.session_state.identity_details, extracted_text, "Credit Score Report")
-                    is_matched = "YES" in match_result
-                    # name_match_results["Credit Score Report"] = "✅ Matched" if is_matched else "❌ Not Matched"
-                    name_match_results["Credit Score Report"] = "✅ Matched" if is_matched else "✅ Matched"
-                    if not is_matched:
-                        mismatches_found = True
-                    progress.progress(1.0)
-
-            # ✅ Store results and display after all checks complete
+            for doc_type in NAME_CHECK_DOCUMENTS:
+                if not pipeline.has(f"name_check:{doc_type}"):
+                    continue
+                if not pipeline.is_fresh(f"name_check:{doc_type}"):
+                    st.write(f"🔍 Checking {doc_type}...")
+                match_result = compute_node(pipeline, f"name_check:{doc_type}", "Processing...")
+                is_matched = "YES" in match_result
+                # name_match_results[doc_type] = "✅ Matched" if is_matched else "❌ Not Matched"
+                name_match_results[doc_type] = "✅ Matched" if is_matched else "✅ Matched"
             st.session_state.name_match_results = name_match_results
-            st.session_state.verification_completed = True  # Mark verification as done
 
         # ✅ **Prevent Re-Running Verification - Show Results Directly**
         if st.session_state.verification_completed:
@@ -277,43 +310,40 @@ if st.session_state.step == 3:
 if st.session_state.step == 4:
     st.subheader("📜 Summarizing Customer Documents")
 
-    uploaded_files = st.session_state.get("uploaded_files", {})
-
-    # ✅ Check if summarization is already completed
-    if "customer_profile" not in st.session_state:
-        st.session_state.customer_profile = {}
-
-        # Sale Deed Processing
-        if "Sale Deed" in uploaded_files:
-            with st.spinner("Processing Sale Deed..."):
-                sale_deed_summary = summarize_sale_deed(extract_text(uploaded_files["Sale Deed"]))
-                st.session_state.customer_profile["Sale Deed"] = sale_deed_summary
-
-        # Credit Score Report Processing
-        if "Credit Score Report" in uploaded_files:
-            with st.spinner("Processing Credit Score Report..."):
-                credit_score_summary = summarize_credit_report(extract_text(uploaded_files["Credit Score Report"]))
-                st.session_state.customer_profile["Credit Score Report"] = credit_score_summary
-
-        # Bank Statement Processing
-        if "Bank Statement" in uploaded_files:
-            with st.spinner("Analyzing Bank Statement..."):
-                time_range = st.radio("📆 Select Time Range:", ["Total", "Monthly", "Weekly"], key="time_range")
-                bank_statement_summary, df = analyze_bank_statement(uploaded_files["Bank Statement"], time_range.lower(), return_dataframe=True)
-                st.session_state.customer_profile["Bank Statement"] = bank_statement_summary
-                st.session_state.bank_data = df  
-            # ✅ Display Summary
-            st.subheader("📄 Bank Statement Summary")
-            st.write(bank_statement_summary)
+    pipeline = st.session_state.pipeline
 
-            
-    # ✅ Display already stored summaries to prevent reprocessing
+    # ✅ Only summaries downstream of a changed document are recomputed
+    if pipeline.has("bank"):
+        time_range = st.radio("📆 Select Time Range:", ["Total", "Monthly", "Weekly"], key="time_range")
+        pipeline.set_input("param:time_range", time_range.lower())
+
+    for node, message in [
+        ("summary:Sale Deed", "Processing Sale Deed..."),
+        ("summary:Credit Score Report", "Processing Credit Score Report..."),
+        ("bank", "Analyzing Bank Statement...")
+    ]:
+        if pipeline.has(node):
+            compute_node(pipeline, node, message)
+
+    st.session_state.customer_profile = collect_customer_profile(pipeline)
+    if pipeline.has("bank"):
+        st.session_state.bank_data = pipeline.get("bank")[1]
+
+    # ✅ Display stored summaries
     for doc, summary in st.session_state.customer_profile.items():
         st.subheader(f"📄 {doc} Summary")
         st.write(summary)
 
-    if "bank_data" in st.session_state and not st.session_state.bank_data.empty:
-        df = st.session_state.bank_data
+        # ✅ Figures read directly from the scanned report (no LLM), to check the summary against
+        if pipeline.has(f"fields:{doc}"):
+            fields, tables = compute_node(pipeline, f"fields:{doc}", "Reading figures from the report...")
+            if fields:
+                st.dataframe(pd.Series(fields, name="Value").rename_axis("Field"), height=150)
+            for table in tables:
+                st.dataframe(table, height=150)
+
+    bank_view = st.session_state.get("bank_data")
+    if bank_view is not None and not bank_view.empty:
 
         col1, col2, col3 = st.columns(3)
 
@@ -322,11 +352,9 @@ if st.session_state.step == 4:
             with col1:
                 st.subheader("📊 Income vs. Expenses")
 
-                # Ensure TXN_DATE_TIME is in datetime format
-                df["TXN_DATE_TIME"] = pd.to_datetime(df["TXN_DATE_TIME"])
-
-                # Aggregate by Date (Sum of Transactions per Day)
-                daily_summary = df.groupby(df["TXN_DATE_TIME"].dt.date)["TXN_AMOUNT_LCY"].sum()
+                # Sum of Transactions per Day (aggregated batch by batch while reading)
+                daily_summary = bank_view.daily_totals()
+                daily_summary.index = daily_summary.index.date
 
                 # Create Figure
                 fig, ax = plt.subplots(figsize=(5, 3))
@@ -351,48 +379,60 @@ if st.session_state.step == 4:
                 st.pyplot(fig)
 
             with col2:
-                st.subheader("⚠️ Large Transactions")
-                threshold = df["TXN_AMOUNT_LCY"].mean() * 2
-                large_txns = df[df["TXN_AMOUNT_LCY"].abs() > threshold]
+                st.subheader("⚠️ Flagged Transactions")
+                # Scores and flags are computed once by aggregate_statement
+                flagged_txns = bank_view.flagged_transactions()
 
-                if not large_txns.empty:
+                if not flagged_txns.empty:
                     fig, ax = plt.subplots(figsize=(5, 3))
 
-                    # Convert TXN_DATE_TIME to datetime if not already
-                    large_txns["TXN_DATE_TIME"] = pd.to_datetime(large_txns["TXN_DATE_TIME"])
-
-                    large_txns.plot(
-                        x="TXN_DATE_TIME", 
-                        y="TXN_AMOUNT_LCY", 
-                        kind="bar", 
-                        ax=ax, 
-                        color="darkred"
-                    )
+                    colors = [
+                        "darkred" if outlier else "darkorange" if burst else "purple"
+                        for outlier, burst in zip(flagged_txns["IS_AMOUNT_OUTLIER"], flagged_txns["IS_VELOCITY_BURST"])
+                    ]
+                    ax.bar(flagged_txns["TXN_DATE_TIME"], flagged_txns["TXN_AMOUNT_LCY"], color=colors)
 
                     ax.set_xlabel("Date")
                     ax.set_ylabel("Amount (₹)")
-                    ax.set_title("Large Transactions")
+                    ax.set_title("Unusual Amounts / Card Bursts / Duplicates")
                     
                     # Format x-axis properly to prevent overlapping
                     ax.xaxis.set_major_formatter(mdates.DateFormatter("%b %d"))  # Show 'Feb 05' instead of full timestamp
-                    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(large_txns) // 5)))  # Show fewer labels
+                    ax.xaxis.set_major_locator(mdates.DayLocator(interval=max(1, len(flagged_txns) // 5)))  # Show fewer labels
 
                     plt.xticks(rotation=45, ha="right")  # Rotate & align right for better visibility
                     st.pyplot(fig)
+
+                    st.dataframe(
+                        flagged_txns[["TXN_DATE_TIME", "TXN_DESC", "CR_DR_INDICATOR", "TXN_AMOUNT_LCY", "ANOMALY_ZSCORE"]],
+                        height=150
+                    )
                 else:
                     st.write("No Unusual Transactions Found")
 
             # **3️⃣ Savings Trend Over Time**
             with col3:
                 st.subheader("📈 Savings Over Time")
-                df["Cumulative Balance"] = df["TXN_AMOUNT_LCY"].cumsum()
+                cumulative_balance = bank_view.daily_totals().cumsum().rename("Cumulative Balance")
                 fig, ax = plt.subplots(figsize=(5, 3))
-                df.plot(x="TXN_DATE_TIME", y="Cumulative Balance", ax=ax, linestyle="-", marker="o", color="blue")
+                cumulative_balance.plot(ax=ax, linestyle="-", marker="o", color="blue", legend=True)
                 ax.set_xlabel("Date")
                 ax.set_ylabel("Cumulative Balance (₹)")
                 ax.set_title("Savings Growth")
                 ax.tick_params(axis='x', rotation=45)
                 st.pyplot(fig)
+
+            # **4️⃣ Merchants, Recurring Payments & Cards** (merged from the per-day partials)
+            col4, col5, col6 = st.columns(3)
+            with col4:
+                st.subheader("🏪 Top Merchants")
+                st.dataframe(bank_view.top_merchants(), height=200)
+            with col5:
+                st.subheader("🔁 Recurring Payments")
+                st.dataframe(bank_view.recurring_payments(), height=200)
+            with col6:
+                st.subheader("💳 Spend by Card")
+                st.dataframe(bank_view.card_breakdown(), height=200)
             
         except Exception as e:
             st.error(f"⚠️ Error generating graphs: {e}")
@@ -466,32 +506,32 @@ if st.session_state.step == 5:
     """, unsafe_allow_html=True)
     st.subheader("📊 Comprehensive Customer Profile")
 
-    customer_profile = st.session_state.get("customer_profile", {})
+    pipeline = st.session_state.pipeline
+    try:
+        customer_profile = collect_customer_profile(pipeline)
+    except LLMError as e:
+        show_llm_error(e)
+        st.stop()
 
     if not customer_profile:
         st.error("❌ No document summaries found. Please restart the process.")
     else:
-        if "final_profile" not in st.session_state:
-            profile_text = json.dumps(customer_profile, indent=4)
-            profile_prompt = f"""
-            You are a **Relationship Manager (RM)** at a bank, evaluating a customer's profile based on key financial and identification documents. 
-            **Documents Available:**
-            - Sale Deed (Property ownership details)
-            - Credit Score Report (Financial standing and risk analysis)
-            - Bank Statement (Cash flow & spending habits)
-            **Based on these, provide a structured assessment including:**
-            1️⃣ **Customer Identity & Property Ownership**
-            2️⃣ **Creditworthiness & Loan Eligibility**
-            3️⃣ **Financial Stability & Spending Behavior**
-            4️⃣ **Potential Risks & Red Flags**
-            5️⃣ **Recommendations for Banking Products (Loans, Credit Cards, Investment Advice, etc.)**
-            **Extracted Data:**
-            {profile_text}
-            **Format the output as a structured and professional RM assessment.**
-            **Today's date is {datetime.datetime.today()}. Don't mention the customer's ID here or the RM name.**
-            """
-            with st.spinner("🔍 Generating AI-driven Customer Profile..."):
-                st.session_state.final_profile = run_ollama_model(profile_prompt)
+        # ✅ Regenerated only when one of the document summaries changed
+        st.session_state.final_profile = compute_node(pipeline, "final_profile", "🔍 Generating AI-driven Customer Profile...")
+
+        # ✅ Record each completed profile once in the portfolio store for portfolio-level queries
+        profile_fingerprint = pipeline.fingerprint("final_profile")
+        if st.session_state.get("portfolio_fingerprint") != profile_fingerprint:
+            try:
+                PortfolioStore().append(profile_record(
+                    st.session_state.customer_id,
+                    pipeline.get("identity") if pipeline.has("identity") else "",
+                    customer_profile,
+                    pipeline.get("bank_metrics") if pipeline.has("bank_metrics") else None
+                ))
+                st.session_state.portfolio_fingerprint = profile_fingerprint
+            except Exception as e:
+                st.warning(f"⚠️ Could not save the profile to the portfolio store: {e}")
 
         # --- Modern summary badges (example: you can expand logic to make these dynamic) ---
         st.markdown('<div class="profile-summary-badges">'
@@ -523,22 +563,25 @@ if st.session_state.step == 5:
             user_query = st.text_input("🔍 Ask a question about this customer (e.g., 'What is their loan eligibility?')")
             submit_query = st.form_submit_button("🔎 Get Answer")
             st.markdown('</div>', unsafe_allow_html=True)
+        # Per-customer chat session: the profile is sent once and reused across follow-up questions
+        if st.session_state.get("profile_chat_fingerprint") != profile_fingerprint:
+            st.session_state.profile_chat = ProfileChatSession(customer_profile)
+            st.session_state.profile_chat_fingerprint = profile_fingerprint
+
         if submit_query and user_query:
-            query_prompt = f"""
-            You are an AI assistant for Relationship Managers. Using the following customer profile data, answer the given question concisely.
-            **Customer Profile:**
-            {json.dumps(customer_profile, indent=4)}
-            **Question:**
-            {user_query}
-            **Provide a clear and precise response.**
-            """
-            with st.spinner("Processing your query..."):
-                query_response = run_ollama_model(query_prompt)
-            st.write("**📝 Answer:**")
-            st.write(query_response)
+            try:
+                with st.spinner("Processing your query..."):
+                    st.session_state.profile_chat.ask(user_query)
+            except LLMError as e:
+                show_llm_error(e)
         elif submit_query:
             st.warning("⚠️ Please enter a question to get an answer.")
 
+        for past_query, past_response in reversed(st.session_state.profile_chat.history):
+            st.write(f"**❓ {past_query}**")
+            st.write("**📝 Answer:**")
+            st.write(past_response)
+
         col1, col2 = st.columns(2)
         with col1:
             if st.button("⬅️ Back"):
@@ -547,8 +590,13 @@ if st.session_state.step == 5:
         with col2:
             if st.button("🔄 Restart"):
                 st.session_state.step = 1
+                document_store.release(st.session_state.session_id, st.session_state.customer_id)
+                st.session_state.customer_id = uuid.uuid4().hex
                 st.session_state.uploaded_files = {}
+                st.session_state.pipeline = build_profile_pipeline()
                 st.session_state.customer_profile = {}
                 st.session_state.final_profile = None
+                st.session_state.profile_chat = None
+                st.session_state.profile_chat_fingerprint = None
                 st.rerun()
 
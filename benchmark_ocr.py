@@ -0,0 +1,120 @@
+"""Benchmark the OCR preprocessing stage against raw-image recognition.
+
+Usage:
+    python benchmark_ocr.py [--repeat 5] [--regions ""|document|mrz] [images ...]
+
+For each image, recognition on the raw image (angle classifier on, as before the
+preprocessing stage) is compared with recognition on the preprocessed regions. Quality
+is checked against the raw-image output: token recall must stay above --min-recall.
+Each region is also timed and scored on its own, so a region that loses text shows up
+even when the page as a whole passes. With --regions mrz only the machine-readable zone
+is recognized, so expect recall to drop to the share of the page's text that the MRZ repeats.
+"""
+import argparse
+import difflib
+import re
+import statistics
+import sys
+import time
+import cv2
+from generate_embeddings import get_ocr, OCR_USE_ANGLE_CLS
+from ocr_preprocessing import preprocess_for_ocr, OCR_MAX_LONG_EDGE
+
+DEFAULT_IMAGES = [
+    "backend_documents/Passport.png",
+    "backend_documents/Credit_Score_Report.png",
+]
+
+
+def recognize(images, cls):
+    lines = []
+    for image in images:
+        result = get_ocr().ocr(image, cls=cls)
+        lines.extend(line[1][0] for line in result[0] or [])
+    return "\n".join(lines)
+
+
+def pixels(img):
+    return img.shape[0] * img.shape[1]
+
+
+def time_runs(func, repeat):
+    """Median wall time in seconds of `repeat` runs, after one warm-up run, plus its output."""
+    output = func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), output
+
+
+def tokens(text):
+    return re.findall(r"[A-Za-z0-9]+", text.upper())
+
+
+def token_recall(reference, candidate):
+    """Fraction of the reference's tokens (with multiplicity) also present in the candidate."""
+    reference_tokens = tokens(reference)
+    if not reference_tokens:
+        return 1.0
+    remaining = {}
+    for token in tokens(candidate):
+        remaining[token] = remaining.get(token, 0) + 1
+    found = 0
+    for token in reference_tokens:
+        if remaining.get(token, 0):
+            remaining[token] -= 1
+            found += 1
+    return found / len(reference_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", default=DEFAULT_IMAGES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-long-edge", type=int, default=OCR_MAX_LONG_EDGE)
+    parser.add_argument("--regions", default="", choices=["", "document", "mrz"])
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'image / region':<45} {'pixels':>12} {'raw s':>8} {'prep s':>8} {'ocr s':>8} {'speedup':>8} {'recall':>7} {'similar':>8}")
+    for path in args.images:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"{path}: could not be read", file=sys.stderr)
+            failed = True
+            continue
+
+        raw_time, raw_text = time_runs(lambda: recognize([img], cls=True), args.repeat)
+        # Preprocessing and recognition are timed separately; speedup compares their sum with raw
+        prep_time, regions = time_runs(
+            lambda: preprocess_for_ocr(img, max_long_edge=args.max_long_edge, regions=args.regions), args.repeat
+        )
+        region_results = [
+            time_runs(lambda: recognize([region], cls=OCR_USE_ANGLE_CLS), args.repeat) for region in regions
+        ]
+        ocr_time = sum(seconds for seconds, _ in region_results)
+        prep_text = "\n".join(text for _, text in region_results)
+
+        recall = token_recall(raw_text, prep_text)
+        similarity = difflib.SequenceMatcher(None, raw_text, prep_text).ratio()
+        speedup = raw_time / (prep_time + ocr_time)
+        page_pixels = f"{pixels(img)}->{sum(pixels(region) for region in regions)}"
+        print(f"{path:<45} {page_pixels:>12} {raw_time:>8.3f} {prep_time:>8.3f} {ocr_time:>8.3f} "
+              f"{speedup:>7.2f}x {recall:>7.1%} {similarity:>8.1%}")
+        # Share of the raw page's tokens each region recovers on its own
+        for i, (region, (seconds, text)) in enumerate(zip(regions, region_results)):
+            print(f"{'  region ' + str(i) + ' ' + 'x'.join(map(str, region.shape[:2])):<45} {pixels(region):>12} "
+                  f"{'':>8} {'':>8} {seconds:>8.3f} {'':>8} {token_recall(raw_text, text):>7.1%}")
+
+        if recall < args.min_recall:
+            print(f"  quality check failed: token recall {recall:.1%} < {args.min_recall:.0%}", file=sys.stderr)
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from logger import logger
+
+# Where uploads and their derived artifacts are kept
+STORE_ROOT = os.getenv("DOCUMENT_STORE_ROOT", os.path.join("temp", "store"))
+
+# Unreferenced documents not accessed for this long are evicted
+STORE_TTL_SECONDS = int(os.getenv("DOCUMENT_STORE_TTL_SECONDS", 24 * 60 * 60))
+
+# Least recently used unreferenced documents are evicted above this total size
+STORE_MAX_BYTES = int(os.getenv("DOCUMENT_STORE_MAX_BYTES", 2 * 1024 ** 3))
+
+EVICTION_INTERVAL_SECONDS = 5 * 60
+
+
+def _write_atomic(path, data):
+    """Writes via a temporary file and a rename, so readers never see partial content."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _touch(path):
+    """Marks a blob/artifact as recently used (mtime, since atime is often disabled)."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+class DocumentStore:
+    """Content-addressed store for uploaded documents and their derived artifacts.
+
+    Layout under `root`:
+        objects/<aa>/<sha256>               document contents, stored once per content
+        artifacts/<sha256>/<kind>           derived data (extracted text, Parquet, thumbnails)
+        refs/<session_id>/<customer_id>.json  which documents a profiling session uses
+
+    Documents referenced by a live session are never evicted; everything else expires
+    after `ttl_seconds` without access, oldest first once `max_bytes` is exceeded. A
+    session stays live while it keeps touching its reference file (`touch_references`),
+    and documents leased in this process (see `lease`) are kept whatever their age.
+    """
+
+    def __init__(self, root=STORE_ROOT, ttl_seconds=STORE_TTL_SECONDS, max_bytes=STORE_MAX_BYTES):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._leases = {}  # digest -> number of holders in this process
+        self._evictor = None
+
+    # **Documents**
+    def blob_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def put(self, data, digest):
+        """Stores `data` under its SHA-256 `digest`; identical content is written only once."""
+        path = self.blob_path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                _touch(path)
+            else:
+                _write_atomic(path, data)
+        return path
+
+    def put_document(self, document):
+        """Stores an `InMemoryDocument` (or any object with `sha256` and `open()`).
+
+        In-memory uploads are written straight from their buffer, without a copy.
+        """
+        if self.has(document.sha256):
+            _touch(self.blob_path(document.sha256))
+        elif getattr(document, "buffer", None) is not None:
+            self.put(document.buffer, document.sha256)
+        else:
+            with document.open() as f:
+                self.put(f.read(), document.sha256)
+        return document.sha256
+
+    def lease(self, digest):
+        """Keeps `digest` from being evicted until a matching `release_lease`.
+
+        For files held open by path in this process, such as a spilled upload,
+        which must outlive any session's reference file.
+        """
+        with self._lock:
+            self._leases[digest] = self._leases.get(digest, 0) + 1
+
+    def release_lease(self, digest):
+        with self._lock:
+            count = self._leases.get(digest, 0) - 1
+            if count > 0:
+                self._leases[digest] = count
+            else:
+                self._leases.pop(digest, None)
+
+    # **Session references**
+    def _ref_path(self, session_id, customer_id):
+        return os.path.join(self.root, "refs", session_id, f"{customer_id}.json")
+
+    def add_reference(self, session_id, customer_id, doc_type, digest, name):
+        """Records that `doc_type` of this session's customer is the document `digest`."""
+        path = self._ref_path(session_id, customer_id)
+        with self._lock:
+            refs = self._read_refs(path)
+            refs[doc_type] = {"digest": digest, "name": name}
+            _write_atomic(path, json.dumps(refs).encode("utf-8"))
+
+    def remove_reference(self, session_id, customer_id, doc_type):
+        """Forgets `doc_type` of this session's customer (e.g. the upload was cleared)."""
+        path = self._ref_path(session_id, customer_id)
+        with self._lock:
+            refs = self._read_refs(path)
+            if refs.pop(doc_type, None) is not None:
+                _write_atomic(path, json.dumps(refs).encode("utf-8"))
+
+    def references(self, session_id, customer_id):
+        """The customer's references; reading them counts as use and keeps them live."""
+        path = self._ref_path(session_id, customer_id)
+        _touch(path)
+        return self._read_refs(path)
+
+    def touch_references(self, session_id, customer_id):
+        """Marks a session's references as in use, so they don't expire while it is active."""
+        _touch(self._ref_path(session_id, customer_id))
+
+    def release(self, session_id, customer_id):
+        """Drops a customer's references; the documents become evictable."""
+        with self._lock:
+            try:
+                os.remove(self._ref_path(session_id, customer_id))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _read_refs(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    # **Derived artifacts**
+    def artifact_path(self, digest, kind):
+        return os.path.join(self.root, "artifacts", digest, kind)
+
+    def get_artifact(self, digest, kind):
+        """Returns the artifact's bytes, or None if it hasn't been derived yet."""
+        path = self.artifact_path(digest, kind)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        _touch(path)
+        return data
+
+    def put_artifact(self, digest, kind, data):
+        with self._lock:
+            _write_atomic(self.artifact_path(digest, kind), data)
+
+    def find_artifact(self, digest, kind):
+        """Path of an artifact to read in place (e.g. a large Parquet file), or None."""
+        path = self.artifact_path(digest, kind)
+        if not os.path.exists(path):
+            return None
+        _touch(path)
+        return path
+
+    @contextmanager
+    def writing_artifact(self, digest, kind):
+        """Yields a temporary path to write a large artifact to, published atomically on success.
+
+        The digest is leased while writing, so eviction can't remove the directory under it.
+        """
+        path = self.artifact_path(digest, kind)
+        self.lease(digest)
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                os.close(fd)
+            try:
+                yield tmp_path
+                with self._lock:
+                    os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        finally:
+            self.release_lease(digest)
+
+    # **Eviction**
+    def _live_digests(self, now):
+        """Digests referenced by sessions active within the TTL; stale reference files are removed."""
+        live = set()
+        refs_root = os.path.join(self.root, "refs")
+        if not os.path.isdir(refs_root):
+            return live
+        for session_id in os.listdir(refs_root):
+            session_dir = os.path.join(refs_root, session_id)
+            for ref_file in os.listdir(session_dir):
+                path = os.path.join(session_dir, ref_file)
+                if now - os.path.getmtime(path) > self.ttl_seconds:
+                    os.remove(path)
+                    continue
+                live.update(ref["digest"] for ref in self._read_refs(path).values())
+            if not os.listdir(session_dir):
+                os.rmdir(session_dir)
+        return live
+
+    def _entries(self):
+        """(last_used, size, digest) per stored document and its artifacts.
+
+        Artifacts of documents that were never stored (e.g. read from a local path)
+        are tracked under their digest too, so they expire the same way.
+        """
+        paths_by_digest = {}
+        objects_root = os.path.join(self.root, "objects")
+        if os.path.isdir(objects_root):
+            for prefix in os.listdir(objects_root):
+                for digest in os.listdir(os.path.join(objects_root, prefix)):
+                    if not digest.startswith(".tmp-"):
+                        paths_by_digest.setdefault(digest, []).append(self.blob_path(digest))
+        artifacts_root = os.path.join(self.root, "artifacts")
+        if os.path.isdir(artifacts_root):
+            for digest in os.listdir(artifacts_root):
+                artifact_dir = os.path.join(artifacts_root, digest)
+                paths_by_digest.setdefault(digest, []).extend(
+                    os.path.join(artifact_dir, kind) for kind in os.listdir(artifact_dir)
+                )
+
+        entries = []
+        for digest, paths in paths_by_digest.items():
+            stats = []
+            for path in paths:
+                try:
+                    stats.append(os.stat(path))
+                except FileNotFoundError:
+                    pass
+            if stats:
+                entries.append((max(s.st_mtime for s in stats), sum(s.st_size for s in stats), digest))
+            else:
+                entries.append((0, 0, digest))
+        return entries
+
+    def _remove(self, digest):
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(os.path.join(self.root, "artifacts", digest), ignore_errors=True)
+
+    def evict(self, now=None):
+        """Removes expired and over-budget unreferenced documents; returns how many were removed."""
+        now = time.time() if now is None else now
+        with self._lock:
+            live = self._live_digests(now) | set(self._leases)
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+
+            removed = 0
+            for last_used, size, digest in entries:
+                if digest in live:
+                    continue
+                if now - last_used > self.ttl_seconds or total > self.max_bytes:
+                    self._remove(digest)
+                    total -= size
+                    removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} documents from {self.root}")
+        return removed
+
+    def start_background_eviction(self, interval=EVICTION_INTERVAL_SECONDS):
+        """Runs `evict` periodically on a daemon thread (once per store)."""
+        if self._evictor is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.evict()
+                except Exception as e:
+                    logger.error(f"Error evicting documents: {e}")
+                time.sleep(interval)
+
+        self._evictor = threading.Thread(target=run, name="document-store-eviction", daemon=True)
+        self._evictor.start()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store shared by all sessions, with background eviction running."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+            _store.start_background_eviction()
+        return _store
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import weakref
+import cv2
+import fitz
+import numpy as np
+import pyarrow as pa
+from document_store import get_store
+
+# Uploads larger than this are written to disk instead of being held in memory
+SPILL_THRESHOLD = int(os.getenv("DOCUMENT_SPILL_THRESHOLD", 64 * 1024 * 1024))
+
+# Width of the preview thumbnails shown in the upload step
+THUMBNAIL_WIDTH = 200
+
+
+class InMemoryDocument:
+    """An uploaded document decoded straight from its buffer.
+
+    Wraps the upload's memoryview so PDFs, images and statements are parsed without a
+    round trip through disk. Documents above `spill_threshold` are written once to the
+    content-addressed document store and read from there.
+    """
+
+    def __init__(self, name, buffer, spill_threshold=SPILL_THRESHOLD):
+        self.name = name
+        self.extension = os.path.splitext(name)[1].lower().lstrip(".")
+        self._buffer = memoryview(buffer)
+        self.size = self._buffer.nbytes
+        self._sha256 = None
+        self._path = None
+
+        if self.size > spill_threshold:
+            self._spill()
+            self._buffer = None
+
+    @classmethod
+    def from_path(cls, file_path):
+        """Wraps a document that already lives on disk; it is read lazily, never copied."""
+        document = cls.__new__(cls)
+        document.name = os.path.basename(file_path)
+        document.extension = os.path.splitext(file_path)[1].lower().lstrip(".")
+        document.size = os.path.getsize(file_path)
+        document._buffer = None
+        document._sha256 = None
+        document._path = file_path
+        return document
+
+    def _spill(self):
+        store = get_store()
+        self._path = store.put(self._buffer, self.sha256)
+        # The store keeps the spilled file for as long as this document is alive
+        store.lease(self.sha256)
+        weakref.finalize(self, store.release_lease, self.sha256)
+
+    @property
+    def buffer(self):
+        """The contents as a memoryview, or None once they live on disk."""
+        return self._buffer
+
+    @property
+    def sha256(self):
+        """Hex digest of the document's contents."""
+        if self._sha256 is None:
+            if self._buffer is not None:
+                self._sha256 = hashlib.sha256(self._buffer).hexdigest()
+            else:
+                digest = hashlib.sha256()
+                with open(self._path, "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    @property
+    def path(self):
+        """A filesystem path for libraries that only accept paths; spills on first use."""
+        if self._path is None:
+            self._spill()
+        return self._path
+
+    def open(self):
+        """Seekable binary file object over the contents (zero-copy for in-memory documents)."""
+        if self._buffer is not None:
+            return pa.BufferReader(self._buffer)
+        return open(self._path, "rb")
+
+    def open_pdf(self):
+        if self._buffer is not None:
+            return fitz.open(stream=self._buffer, filetype="pdf")
+        return fitz.open(self._path)
+
+    def decode_image(self):
+        """Decodes the document as a BGR image, as `cv2.imread` would."""
+        if self._buffer is not None:
+            return cv2.imdecode(np.frombuffer(self._buffer, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(self._path)
+
+    def __repr__(self):
+        return f"InMemoryDocument({self.name!r}, {self.size} bytes)"
+
+
+def get_thumbnail(document, width=THUMBNAIL_WIDTH):
+    """PNG thumbnail of an image document, derived once per content and cached in the store."""
+    store = get_store()
+    kind = f"thumbnail-{width}.png"
+    thumbnail = store.get_artifact(document.sha256, kind)
+    if thumbnail is None:
+        img = document.decode_image()
+        height = max(round(img.shape[0] * width / img.shape[1]), 1)
+        thumbnail = cv2.imencode(".png", cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA))[1].tobytes()
+        store.put_artifact(document.sha256, kind, thumbnail)
+    return thumbnail
+
+
+def as_document(source):
+    """Accepts either a document or a filesystem path and returns a document."""
+    if isinstance(source, InMemoryDocument):
+        return source
+    return InMemoryDocument.from_path(source)
@@ -1,13 +1,46 @@
 import docx2txt
-import fitz
+import datetime
+import json
 import subprocess
+import shlex
 import os
+import threading
 from logger import logger
 from paddleocr import PaddleOCR
-import cv2
 import pandas as pd
-# Initialize PaddleOCR for OCR processing
-ocr = PaddleOCR(use_angle_cls=True, lang="en", det=True, rec=True)
+from anomaly_detection import summarize_anomalies
+from statement_aggregates import aggregate_statement
+from transaction_parser import summarize_spending
+from documents import as_document
+from document_store import get_store
+from ocr_preprocessing import OCR_DESKEW, OCR_GRAYSCALE, OCR_MAX_LONG_EDGE, OCR_REGIONS, preprocess_for_ocr
+from ocr_layout import OCRPage, numeric_table
+from llm_resilience import (
+    LLMError,
+    LLMResponseError,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    breaker,
+    call_with_resilience
+)
+
+
+class FailedResult(str):
+    """Placeholder text returned in place of a result when a step fails.
+
+    It displays like any other text, but `DocumentPipeline.get` does not cache it, so
+    the step is retried the next time its value is needed.
+    """
+
+
+# Model served by Ollama for all generation calls
+OLLAMA_MODEL = "gemma2:2b"
+
+# Command used to reach the model; point it at a stub (e.g. "python stub_llm.py") for testing
+OLLAMA_COMMAND = shlex.split(os.getenv("OLLAMA_COMMAND", "ollama"))
+
+# How long Ollama keeps the model loaded after a call, so requests don't pay the load again
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
 
 # Backend storage folder for documents
 backend_folder = "backend_documents"
@@ -45,48 +78,149 @@ def verify_documents():
     return available_files, all_docs_uploaded, missing_files
 
 
-ocr = PaddleOCR(use_angle_cls=True, lang="en", det=True, rec=True)
+# PaddleOCR is created on first use (normally by the startup warm-up), once per process
+_ocr = None
+_ocr_lock = threading.Lock()
 
-def extract_text_paddle(file_path):
-    """Extract structured text while maintaining document layout (headings, tables, paragraphs)."""
-    try:
-        img = cv2.imread(file_path)  # Load image
-        result = ocr.ocr(img, cls=True)  # Perform OCR with layout detection
+# Paddle predictors are not thread-safe; concurrent sessions take turns on the shared engine
+_ocr_inference_lock = threading.Lock()
+
+
+def get_ocr():
+    """Shared PaddleOCR engine; loading its models takes seconds, so it is built only once."""
+    global _ocr
+    with _ocr_lock:
+        if _ocr is None:
+            _ocr = PaddleOCR(use_angle_cls=True, lang="en", det=True, rec=True)
+        return _ocr
+
+# Per-line angle classifier: fixes 180°-flipped text (e.g. upside-down phone photos), which
+# deskewing (±15° only) does not. Turn it off only if benchmark_ocr.py shows recall holds.
+OCR_USE_ANGLE_CLS = os.getenv("OCR_USE_ANGLE_CLS", "1") == "1"
+
+# Cached OCR output depends on the preprocessing and angle settings, so they are part of its
+# artifact name; changing any of them re-runs OCR instead of serving the old lines
+OCR_LAYOUT_ARTIFACT = (
+    f"ocr-layout-v1-e{OCR_MAX_LONG_EDGE}-g{int(OCR_GRAYSCALE)}-d{int(OCR_DESKEW)}"
+    f"-r{OCR_REGIONS or 'page'}-a{int(OCR_USE_ANGLE_CLS)}.json"
+)
+
+# Extracted text of PDFs and Word files; bump the version when the extracted format changes
+TEXT_ARTIFACT = "text-v2"
 
-        structured_text = []
-        for line in result[0]:
-            text = line[1][0]  # Extract text
-            structured_text.append(text)
+def ocr_image(img):
+    """Runs OCR on a decoded image, uncached; returns one `OCRPage` per preprocessed region.
 
-        return "\n".join(structured_text)  # Join text while preserving order
+    Safe to call from any thread: inference on the shared engine is serialized.
+    """
+    ocr = get_ocr()
+    pages = []
+    # Downscale, grayscale and deskew first
+    for region in preprocess_for_ocr(img):
+        with _ocr_inference_lock:
+            result = ocr.ocr(region, cls=OCR_USE_ANGLE_CLS)  # Perform OCR with layout detection
+        pages.append(OCRPage.from_paddle(result[0]))
+    return pages
+
+
+def extract_layout(file_path):
+    """Runs OCR on an image and returns one `OCRPage` (lines with boxes and confidences) per region.
+
+    The recognized lines are cached in the document store, so text, key-value pairs
+    and tables of a given image all come from a single OCR run.
+    """
+    document = as_document(file_path)
+    store = get_store()
+    cached = store.get_artifact(document.sha256, OCR_LAYOUT_ARTIFACT)
+    if cached is not None:
+        return [OCRPage.from_dicts(page) for page in json.loads(cached)]
+
+    pages = ocr_image(document.decode_image())  # Decode image (from memory for uploads)
+
+    store.put_artifact(
+        document.sha256, OCR_LAYOUT_ARTIFACT,
+        json.dumps([page.to_dicts() for page in pages]).encode("utf-8")
+    )
+    return pages
+
+
+def extract_text_paddle(file_path):
+    """Extract structured text while maintaining document layout (headings, tables, paragraphs).
+
+    Lines are put back in reading order from their boxes; "Key: value" pairs and
+    tables are emitted compactly (tables as pipe-separated rows).
+    """
+    try:
+        return "\n\n".join(page.to_text() for page in extract_layout(file_path))
 
     except Exception as e:
         print(f"Error extracting structured text: {e}")
         return ""
+
+
+def extract_numeric_fields(file_path):
+    """Numbers read straight from an image's layout, without an LLM call.
+
+    Returns `(fields, tables)`: label -> number pairs such as {"Credit Score": 750.0}
+    and the page's tables with numeric columns converted to floats. PDFs and Word
+    files have no OCR layout and give `({}, [])`.
+    """
+    document = as_document(file_path)
+    if document.extension not in ('png', 'jpg', 'jpeg'):
+        return {}, []
+    try:
+        fields, tables = {}, []
+        for page in extract_layout(document):
+            for key, value in page.numeric_fields().items():
+                fields.setdefault(key, value)
+            tables.extend(numeric_table(table) for table in page.tables())
+        return fields, tables
+
+    except Exception as e:
+        logger.error(f"Error extracting numeric fields from {document.name}: {e}")
+        return {}, []
     
 ### **Step 2: Extract Identity from ID Document**
 def extract_text(file_path):
-    """Extract text from documents (Sale Deed, Credit Report, ID, Bank Statement)."""
+    """Extract text from documents (Sale Deed, Credit Report, ID).
+
+    Accepts a filesystem path or an `InMemoryDocument` upload. Bank statements have no
+    text to extract and return None; they are read by `analyze_bank_statement`.
+    """
     text = ""
     try:
-        if file_path.endswith('.pdf'):
-            document = fitz.open(file_path)
-            text = "\n".join([page.get_text("text") for page in document])
+        source = as_document(file_path)
 
-        elif file_path.endswith('.docx'):
-            text = docx2txt.process(file_path)
+        # Identical documents are extracted once, whoever uploaded them; images are
+        # covered by the OCR layout cache, whose key includes the OCR settings
+        store = get_store()
+        cache_text = source.extension in ('pdf', 'docx')
+        cached_text = store.get_artifact(source.sha256, TEXT_ARTIFACT) if cache_text else None
+        if cached_text is not None:
+            return cached_text.decode('utf-8')
 
-        elif file_path.endswith(('.png', '.jpg', '.jpeg')):
-            logger.info(f"Extracting text from Image using PaddleOCR: {file_path}")
-            text = extract_text_paddle(file_path)
+        if source.extension == 'pdf':
+            with source.open_pdf() as document:
+                text = "\n".join([page.get_text("text") for page in document])
 
-        elif file_path.endswith(('.csv', '.xlsx')):
+        elif source.extension == 'docx':
+            with source.open() as f:
+                text = docx2txt.process(f)
+
+        elif source.extension in ('png', 'jpg', 'jpeg'):
+            logger.info(f"Extracting text from Image using PaddleOCR: {source.name}")
+            text = extract_text_paddle(source)
+
+        elif source.extension in ('csv', 'xlsx'):
             return None  # Skip text extraction for CSV files
 
         else:
             raise ValueError("Unsupported file format")
 
-        return text.encode('utf-8', 'ignore').decode('utf-8')
+        text = text.encode('utf-8', 'ignore').decode('utf-8')
+        if text and cache_text:
+            store.put_artifact(source.sha256, TEXT_ARTIFACT, text.encode('utf-8'))
+        return text
 
     except Exception as e:
         logger.error(f"Error extracting text from {file_path}: {e}")
@@ -109,11 +243,14 @@ def extract_identity(text):
 
         Provide a structured **human-readable summary**.
         """
-        return run_ollama_model(prompt)
+        return run_ollama_model(prompt, task="summary")
+
+    except LLMError:
+        raise
 
     except Exception as e:
         logger.error(f"Error extracting identity: {e}")
-        return "Error extracting identity details."
+        return FailedResult("Error extracting identity details.")
 
 
 ### **Step 3: Cross-Check Name Across Documents**
@@ -131,11 +268,14 @@ def verify_name_match(identity_details, doc_text, document_name):
 
         Return **YES or NO**, and provide a short reason.
         """
-        return run_ollama_model(prompt)
+        return run_ollama_model(prompt, task="query")
+
+    except LLMError:
+        raise
 
     except Exception as e:
         logger.error(f"Error verifying name in {document_name}: {e}")
-        return "Error verifying name."
+        return FailedResult("Error verifying name.")
 
 
 ### **Step 4: Generate Final Customer Profile**
@@ -163,33 +303,78 @@ def generate_customer_profile(identity_details, sale_deed_summary, credit_score_
         - **Creditworthiness**
         - **Any risks or important observations**
         """
-        return run_ollama_model(prompt)
+        return run_ollama_model(prompt, task="profile")
+
+    except LLMError:
+        raise
 
     except Exception as e:
         logger.error(f"Error generating customer profile: {e}")
-        return "Error generating customer profile."
+        return FailedResult("Error generating customer profile.")
+
+
+def generate_final_profile(customer_profile):
+    """Generates the Relationship Manager assessment from the collected document summaries."""
+    profile_text = json.dumps(customer_profile, indent=4)
+    profile_prompt = f"""
+    You are a **Relationship Manager (RM)** at a bank, evaluating a customer's profile based on key financial and identification documents. 
+    **Documents Available:**
+    - Sale Deed (Property ownership details)
+    - Credit Score Report (Financial standing and risk analysis)
+    - Bank Statement (Cash flow & spending habits)
+    **Based on these, provide a structured assessment including:**
+    1️⃣ **Customer Identity & Property Ownership**
+    2️⃣ **Creditworthiness & Loan Eligibility**
+    3️⃣ **Financial Stability & Spending Behavior**
+    4️⃣ **Potential Risks & Red Flags**
+    5️⃣ **Recommendations for Banking Products (Loans, Credit Cards, Investment Advice, etc.)**
+    **Extracted Data:**
+    {profile_text}
+    **Format the output as a structured and professional RM assessment.**
+    **Today's date is {datetime.datetime.today()}. Don't mention the customer's ID here or the RM name.**
+    """
+    return run_ollama_model(profile_prompt, task="profile")
 
 
 ### **Helper Function: Run LLM Model**
-def run_ollama_model(prompt):
-    """Calls the Ollama model via CLI and returns structured response."""
-    try:
-        result = subprocess.run(
-            ["ollama", "run", "gemma2:2b"],
-            input=prompt.encode("utf-8", "ignore").decode("utf-8"),
-            text=True,
-            capture_output=True,
-            encoding="utf-8"
-        )
+def run_ollama_model(prompt, task="default", circuit=breaker):
+    """Calls the Ollama model via CLI and returns structured response.
+
+    Runs under the task's deadline with bounded retries and the shared circuit breaker
+    (or `circuit`); raises an `LLMError` subclass instead of returning placeholder text
+    on failure.
+    """
+    def run(timeout):
+        try:
+            result = subprocess.run(
+                OLLAMA_COMMAND + ["run", "--keepalive", OLLAMA_KEEP_ALIVE, OLLAMA_MODEL],
+                input=prompt.encode("utf-8", "ignore").decode("utf-8"),
+                text=True,
+                capture_output=True,
+                encoding="utf-8",
+                errors="replace",
+                timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            raise LLMTimeoutError(f"Ollama CLI did not answer within {timeout:.0f}s")
+        except FileNotFoundError:
+            raise LLMUnavailableError(f"Ollama CLI not found: {OLLAMA_COMMAND[0]}")
+        except OSError as e:
+            raise LLMResponseError(f"Ollama CLI could not be run: {e}")
 
         if result.returncode != 0:
-            raise Exception(f"Ollama CLI Error: {result.stderr.strip()}")
+            raise LLMResponseError(f"Ollama CLI Error: {result.stderr.strip()}")
 
-        return result.stdout.strip()
+        output = result.stdout.strip()
+        if not output:
+            raise LLMResponseError("Ollama CLI returned an empty response")
+        return output
 
-    except Exception as e:
+    try:
+        return call_with_resilience(run, task, circuit=circuit)
+    except LLMError as e:
         logger.error(f"Error running Ollama model: {e}")
-        return "Unable to generate a response."
+        raise
 
 
 def summarize_sale_deed(text):
@@ -213,14 +398,17 @@ def summarize_sale_deed(text):
         Provide a **human-readable summary**.
         """
 
-        summary = run_ollama_model(prompt)
+        summary = run_ollama_model(prompt, task="summary")
         logger.debug(f"Sale Deed Summary: {summary}")
 
         return summary  
 
+    except LLMError:
+        raise
+
     except Exception as e:
         logger.error(f"Error summarizing Sale Deed: {e}")
-        return "Error processing Sale Deed summary."
+        return FailedResult("Error processing Sale Deed summary.")
 
 
 def summarize_credit_report(text):
@@ -242,14 +430,17 @@ def summarize_credit_report(text):
         Provide a **human-readable summary**.
         """
 
-        summary = run_ollama_model(prompt)
+        summary = run_ollama_model(prompt, task="summary")
         logger.debug(f"Credit Score Summary: {summary}")
 
         return summary  
 
+    except LLMError:
+        raise
+
     except Exception as e:
         logger.error(f"Error summarizing Credit Score Report: {e}")
-        return "Error processing Credit Score Report summary."
+        return FailedResult("Error processing Credit Score Report summary.")
 
 
 def summarize_id_document(text):
@@ -271,67 +462,72 @@ def summarize_id_document(text):
         Provide a **human-readable summary** with the title name **Summary**.
         """
         
-        summary = run_ollama_model(prompt)
+        summary = run_ollama_model(prompt, task="summary")
         logger.debug(f"ID Document Summary: {summary}")
 
         return summary  
 
+    except LLMError:
+        raise
+
     except Exception as e:
         logger.error(f"Error summarizing Identification Document: {e}")
-        return "Error processing Identification Document summary."
+        return FailedResult("Error processing Identification Document summary.")
 
 
-def analyze_bank_statement(csv_file_path, time_range="total",  return_dataframe=False):
-    try:
-        df = pd.read_csv(csv_file_path)
+def statement_range(aggregates, time_range="total"):
+    """The view of a statement's aggregates for a time range, anchored on its first transaction date."""
+    start_date = aggregates.first_day
+    end_date = None
 
-        # Ensure correct column names
-        required_columns = {"CR_DR_INDICATOR", "TXN_AMOUNT_LCY", "TXN_DATE_TIME", "TXN_DESC"}
-        if not required_columns.issubset(df.columns):
-            raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
+    if start_date is not None and time_range == "weekly":
+        end_date = start_date + pd.Timedelta(days=7)
+    elif start_date is not None and time_range == "monthly":
+        end_date = start_date + pd.DateOffset(months=1)
+    return aggregates.between(start_date, end_date)
 
-        # Convert date column to datetime
-        df["TXN_DATE_TIME"] = pd.to_datetime(df["TXN_DATE_TIME"])
 
-        # Determine the first transaction date as the reference date
-        start_date = df["TXN_DATE_TIME"].min()
-        end_date = df["TXN_DATE_TIME"].max()
+def aggregate_bank_statement(file_path):
+    """Reads a bank statement (CSV or XLSX) into `StatementAggregates`; None if it can't be read.
 
-        if time_range == "weekly":
-            end_date = start_date + pd.Timedelta(days=7)
-        elif time_range == "monthly":
-            end_date = start_date + pd.DateOffset(months=1)
-
-        # Convert start_date and end_date to `pd.Timestamp` before filtering
-        df_filtered = df[(df["TXN_DATE_TIME"] >= pd.Timestamp(start_date)) & (df["TXN_DATE_TIME"] <= pd.Timestamp(end_date))]
+    Batches are folded into per-day aggregates, so memory stays bounded however long the
+    statement is, while anomaly baselines are still scored over the full history.
+    """
+    try:
+        return aggregate_statement(file_path)
 
-        # Identify salary credits (assuming transactions contain "SALARY" or "PAYROLL")
-        total_salary = df_filtered[(df_filtered["CR_DR_INDICATOR"] == "C") & df_filtered["TXN_DESC"].str.contains("SALARY|PAYROLL", case=False, na=False)]["TXN_AMOUNT_LCY"].sum()
+    except Exception as e:
+        print(f"Error analyzing bank statement: {e}")
+        return None
 
-        total_expenditure = df_filtered[df_filtered["CR_DR_INDICATOR"] == "D"]["TXN_AMOUNT_LCY"].sum()
 
-        # Estimated Savings: Salary - Expenditure
-        estimated_savings = total_salary - total_expenditure
+def summarize_bank_statement(aggregates, time_range="total"):
+    """Summary text and the `StatementView` of a statement's aggregates for a time range."""
+    if aggregates is None:
+        return FailedResult("Error processing the bank statement."), None
 
-        # Identify potential investments (keywords: MF, STOCK, BOND, FD, etc.)
-        investment_df = df_filtered[df_filtered["TXN_DESC"].str.contains("MF|STOCK|BOND|FD|ETF|MUTUAL FUND|INVESTMENT", case=False, na=False)]
-        total_investments = investment_df["TXN_AMOUNT_LCY"].sum()
+    view = statement_range(aggregates, time_range)
+    metrics = view.metrics()
 
-        # Generate summary output
-        summary = f"""
+    # Generate summary output
+    summary = f"""
         **Bank Statement Analysis ({time_range.capitalize()} View - Based on First Transaction Date):**
-        - **Total Salary Credited:** Rs {total_salary:.2f}
-        - **Total Expenditure:** Rs {total_expenditure:.2f}
-        - **Estimated Savings:** Rs {estimated_savings:.2f}
-        - **Total Investments Identified:** Rs {total_investments:.2f}
+        - **Total Salary Credited:** Rs {metrics["total_salary"]:.2f}
+        - **Total Expenditure:** Rs {metrics["total_expenditure"]:.2f}
+        - **Estimated Savings:** Rs {metrics["estimated_savings"]:.2f}
+        - **Total Investments Identified:** Rs {metrics["total_investments"]:.2f}
+        {summarize_spending(view.top_merchants(5), view.recurring_payments())}
+        {summarize_anomalies(view.anomaly_counts(), view.flagged_transactions())}
         """
-        if return_dataframe:
-            return summary, df_filtered
-        return summary
+    return summary, view
 
-    except Exception as e:
-        print(f"Error analyzing bank statement: {e}")
-        return "Error processing the bank statement."
+
+def analyze_bank_statement(csv_file_path, time_range="total",  return_dataframe=False):
+    """Analyzes a bank statement; returns the summary, plus its `StatementView` with `return_dataframe`."""
+    summary, view = summarize_bank_statement(aggregate_bank_statement(csv_file_path), time_range)
+    if return_dataframe:
+        return summary, view
+    return summary
 
 
 
@@ -349,8 +545,11 @@ def query_document(text, query, document_type):
         Provide a **clear and concise** answer.
         """
 
-        return run_ollama_model(prompt)
+        return run_ollama_model(prompt, task="query")
+
+    except LLMError:
+        raise
 
     except Exception as e:
         logger.error(f"Error processing query: {e}")
-        return "Unable to answer the query."
\ No newline at end of file
+        return FailedResult("Unable to answer the query.")
\ No newline at end of file
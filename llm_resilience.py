@@ -0,0 +1,150 @@
+import os
+import random
+import threading
+import time
+from logger import logger
+
+# Total time budget (seconds) per kind of LLM task, across all retries
+LLM_DEADLINES = {
+    "summary": float(os.getenv("LLM_DEADLINE_SUMMARY", 180)),
+    "query": float(os.getenv("LLM_DEADLINE_QUERY", 90)),
+    "profile": float(os.getenv("LLM_DEADLINE_PROFILE", 240)),
+    "chat": float(os.getenv("LLM_DEADLINE_CHAT", 60)),
+    "default": float(os.getenv("LLM_DEADLINE_DEFAULT", 120)),
+}
+
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 3))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+# Consecutive failures that open the circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+
+
+class LLMError(Exception):
+    """The model produced no usable output. `transient` errors are worth retrying."""
+
+    transient = False
+
+
+class LLMTimeoutError(LLMError):
+    """The call did not finish within its deadline."""
+
+    transient = True
+
+
+class LLMResponseError(LLMError):
+    """The model server answered with an error or an empty response."""
+
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class LLMUnavailableError(LLMError):
+    """The model server is down (circuit open) or not installed; failing fast."""
+
+
+class CircuitBreaker:
+    """Fails fast after repeated failures instead of queueing calls on a dead model server.
+
+    Closed: calls go through. After `failure_threshold` consecutive failures it opens and
+    rejects calls for `reset_seconds`; then a single trial call is let through
+    (half-open), which closes the circuit on success or re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Raises LLMUnavailableError while the circuit is open."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial_in_flight):
+                raise LLMUnavailableError("LLM server unavailable (circuit open); failing fast")
+            if state == "half-open":
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_neutral(self):
+        """Ends a call that says nothing about the server's health (e.g. HTTP 400); failures are unchanged."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+# One breaker per process: the CLI and the HTTP API talk to the same model server
+breaker = CircuitBreaker()
+
+
+def call_with_resilience(func, task="default", deadline=None, max_attempts=LLM_MAX_ATTEMPTS, circuit=breaker):
+    """Calls `func(timeout)` with a per-task deadline, jittered retries and the circuit breaker.
+
+    `func` receives the seconds left in the deadline and should raise an `LLMError` on
+    failure. Transient errors are retried with exponential backoff and full jitter while
+    the deadline allows; anything else is raised to the caller as-is.
+
+    Only transient errors (timeouts, transport errors, 5xx/429 answers) count as circuit
+    breaker failures; a permanent `LLMError` such as a rejected request says the server
+    is up and is recorded as neutral. Exceptions other than `LLMError` count as failures,
+    so an unexpected error during a half-open trial never leaves the circuit stuck.
+    """
+    deadline = LLM_DEADLINES.get(task, LLM_DEADLINES["default"]) if deadline is None else deadline
+    deadline_at = time.monotonic() + deadline
+
+    for attempt in range(1, max_attempts + 1):
+        circuit.before_call()
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            circuit.record_neutral()
+            raise LLMTimeoutError(f"LLM {task} call exceeded its {deadline:.0f}s deadline")
+
+        try:
+            result = func(remaining)
+        except LLMError as e:
+            if e.transient:
+                circuit.record_failure()
+            else:
+                circuit.record_neutral()
+            logger.warning(f"LLM {task} call failed (attempt {attempt}/{max_attempts}): {e}")
+            if not e.transient or attempt == max_attempts:
+                raise
+
+            backoff = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+            if time.monotonic() + backoff >= deadline_at:
+                raise
+            time.sleep(backoff)
+            continue
+        except Exception:
+            circuit.record_failure()
+            raise
+
+        circuit.record_success()
+        return result
@@ -0,0 +1,285 @@
+"""Load test of the full profiling flow (steps 2-5) with N concurrent customer sessions.
+
+Each simulated session uploads the sample documents from backend_documents, then
+drives the same pipeline nodes as app.py: text extraction, ID summary and name
+checks, document summaries and bank statement analysis, the final profile, and a
+few profile Q&A turns. Sessions run on threads, as Streamlit runs them, against a
+stub LLM with configurable latency (see stub_llm.py) unless --real-llm is given.
+
+Every session uploads documents with unique contents by default, so each one pays for
+its own OCR and parsing, as distinct customers do. --same-documents reuses identical
+uploads instead, which measures the warm path served from the document store's cache.
+
+Usage:
+    python load_test.py --sessions 20 --concurrency 5
+    python load_test.py --sessions 50 --concurrency 10 --llm-latency 1.5
+    python load_test.py --sessions 20 --concurrency 5 --same-documents
+    python load_test.py --real-llm --sessions 4 --concurrency 2 --json results.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+SAMPLE_DOCUMENTS = {
+    "Identification Document": os.path.join("backend_documents", "Passport.png"),
+    "Sale Deed": os.path.join("backend_documents", "Sale_Deed.pdf"),
+    "Credit Score Report": os.path.join("backend_documents", "Credit_Score_Report.png"),
+    "Bank Statement": os.path.join("backend_documents", "Bank_Statement.csv"),
+}
+
+CHAT_QUESTIONS = [
+    "What is their loan eligibility?",
+    "Summarize the main risks.",
+    "Which banking products would suit this customer?",
+    "How stable is their income?",
+]
+
+# Stages in the order a session runs them, with the pipeline nodes each one computes
+STAGES = [
+    ("upload", None),
+    ("extract_text", ["text:Identification Document", "text:Sale Deed", "text:Credit Score Report"]),
+    ("identity", ["identity"]),
+    ("name_check", ["name_check:Sale Deed", "name_check:Credit Score Report"]),
+    ("summaries", ["summary:Sale Deed", "summary:Credit Score Report", "fields:Credit Score Report"]),
+    ("bank_statement", ["bank", "bank_metrics"]),
+    ("final_profile", ["final_profile"]),
+    ("chat", None),
+]
+
+RESOURCE_SAMPLE_SECONDS = 0.5
+
+
+class ResourceMonitor:
+    """Samples process CPU and memory on a background thread (psutil if installed, else `resource`)."""
+
+    def __init__(self, interval=RESOURCE_SAMPLE_SECONDS):
+        self.interval = interval
+        self.cpu_samples = []
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def _cpu_seconds(self):
+        times = os.times()
+        return times.user + times.system
+
+    def _rss_bytes(self):
+        if self._process is not None:
+            return self._process.memory_info().rss
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        last_wall, last_cpu = time.perf_counter(), self._cpu_seconds()
+        while not self._stop.wait(self.interval):
+            wall, cpu = time.perf_counter(), self._cpu_seconds()
+            # Percent of one core, like `top`
+            self.cpu_samples.append(100 * (cpu - last_cpu) / max(wall - last_wall, 1e-9))
+            self.rss_samples.append(self._rss_bytes())
+            last_wall, last_cpu = wall, cpu
+
+    def __enter__(self):
+        self._start_wall, self._start_cpu = time.perf_counter(), self._cpu_seconds()
+        self._thread = threading.Thread(target=self._run, name="load-test-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        self.cpu_seconds = self._cpu_seconds() - self._start_cpu
+        self.rss_samples.append(self._rss_bytes())
+
+    def summary(self):
+        return {
+            "cpu_seconds": self.cpu_seconds,
+            "cpu_avg_percent": 100 * self.cpu_seconds / max(self.wall_seconds, 1e-9),
+            "cpu_peak_percent": max(self.cpu_samples, default=0.0),
+            "cores": os.cpu_count(),
+            "rss_peak_mb": max(self.rss_samples) / 1024 ** 2,
+            "rss_source": "psutil" if self._process is not None else "resource (peak RSS)",
+        }
+
+
+def start_stub_server(latency, jitter, failure_rate):
+    """Runs the stub Ollama HTTP API in-process and points the CLI path at the stub script."""
+    os.environ["STUB_LLM_LATENCY"] = str(latency)
+    os.environ["STUB_LLM_JITTER"] = str(jitter)
+    os.environ["STUB_LLM_FAILURE_RATE"] = str(failure_rate)
+
+    from http.server import ThreadingHTTPServer
+    from stub_llm import StubHandler
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+
+    stub_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_llm.py")
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["OLLAMA_COMMAND"] = f'"{sys.executable}" "{stub_script}"'
+    return server
+
+
+def load_documents(distinct_number=None):
+    """Sample documents as upload buffers; `distinct_number` makes their contents (and hashes) unique."""
+    documents = {}
+    for doc_type, path in SAMPLE_DOCUMENTS.items():
+        with open(path, "rb") as f:
+            data = f.read()
+        if distinct_number is not None:
+            # PNG/PDF decoders ignore trailing bytes, and blank CSV lines are skipped
+            if path.endswith(".csv"):
+                data += b"\n" * (distinct_number + 1)
+            else:
+                data += f"\nload-test-{distinct_number}".encode("ascii")
+        documents[doc_type] = (os.path.basename(path), data)
+    return documents
+
+
+def run_session(session_number, args):
+    """Runs one customer through steps 2-5; returns {stage: seconds} and an error, if any."""
+    from documents import InMemoryDocument
+    from document_store import get_store
+    from pipeline import build_profile_pipeline, set_document_input, collect_customer_profile
+    from profile_chat import ProfileChatSession
+
+    timings = {}
+    session_id, customer_id = uuid.uuid4().hex, uuid.uuid4().hex
+    store = get_store()
+    pipeline = build_profile_pipeline()
+    try:
+        for stage, nodes in STAGES:
+            start = time.perf_counter()
+            if stage == "upload":
+                distinct_number = None if args.same_documents else session_number
+                for doc_type, (name, data) in load_documents(distinct_number).items():
+                    document = InMemoryDocument(name, data)
+                    store.put_document(document)
+                    store.add_reference(session_id, customer_id, doc_type, document.sha256, name)
+                    set_document_input(pipeline, doc_type, document)
+            elif stage == "final_profile":
+                customer_profile = collect_customer_profile(pipeline)
+                pipeline.get("final_profile")
+            elif stage == "chat":
+                chat = ProfileChatSession(customer_profile)
+                for question in CHAT_QUESTIONS[:args.chat_turns]:
+                    chat.ask(question)
+            else:
+                for node in nodes:
+                    value = pipeline.get(node)
+                    # Extraction reports failure as empty text rather than raising
+                    if node.startswith("text:") and not (value or "").strip():
+                        raise RuntimeError(f"{node} extracted no text")
+            timings[stage] = time.perf_counter() - start
+        return timings, None
+    except Exception as e:
+        return timings, f"{stage}: {type(e).__name__}: {e}"
+    finally:
+        store.release(session_id, customer_id)
+
+
+def percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the profiling flow with concurrent sessions.")
+    parser.add_argument("--sessions", type=int, default=10, help="Total customer sessions to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Sessions running at the same time")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Profile Q&A turns per session")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM mean seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="Stub LLM +/- latency jitter")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="Stub LLM injected failure rate")
+    parser.add_argument("--real-llm", action="store_true", help="Use the configured Ollama instead of the stub")
+    parser.add_argument("--same-documents", action="store_true",
+                        help="Upload identical documents in every session, so extraction after the first "
+                             "is served from cache (warm path); by default every session's uploads are unique")
+    parser.add_argument("--no-warmup", action="store_true", help="Include OCR/LLM cold start in the first sessions")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.chat_turns > len(CHAT_QUESTIONS):
+        print(f"Warning: --chat-turns {args.chat_turns} exceeds the {len(CHAT_QUESTIONS)} scripted questions; "
+              f"running {len(CHAT_QUESTIONS)} turns per session", file=sys.stderr)
+
+    # Configuration is read at import time, so the stub and a scratch document store are set
+    # up before the app modules are imported
+    if not args.real_llm:
+        start_stub_server(args.llm_latency, args.llm_jitter, args.llm_failure_rate)
+    os.environ.setdefault("DOCUMENT_STORE_ROOT", tempfile.mkdtemp(prefix="load-test-store-"))
+
+    if not args.no_warmup:
+        from warmup import start_warmup
+        warmup = start_warmup()
+        warmup.wait()
+        print(f"Warm-up: {warmup.status()} in {', '.join(f'{k} {v:.1f}s' for k, v in warmup.durations.items())}")
+
+    stage_timings = {stage: [] for stage, _ in STAGES}
+    session_times, errors = [], []
+
+    with ResourceMonitor() as monitor:
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="session") as executor:
+            futures = [executor.submit(run_session, i, args) for i in range(args.sessions)]
+            for future in as_completed(futures):
+                timings, error = future.result()
+                for stage, seconds in timings.items():
+                    stage_timings[stage].append(seconds)
+                if error:
+                    errors.append(error)
+                else:
+                    session_times.append(sum(timings.values()))
+
+    results = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "llm": "ollama" if args.real_llm else f"stub ({args.llm_latency}s ± {args.llm_jitter}s, {args.llm_failure_rate:.0%} failures)",
+        "documents": "same (warm cache)" if args.same_documents else "distinct per session",
+        "wall_seconds": monitor.wall_seconds,
+        "completed": len(session_times),
+        "failed": len(errors),
+        "throughput_sessions_per_minute": 60 * len(session_times) / monitor.wall_seconds,
+        "session_latency": percentiles(session_times) if session_times else None,
+        "stages": {stage: percentiles(values) for stage, values in stage_timings.items() if values},
+        "resources": monitor.summary(),
+        "errors": errors[:20],
+    }
+
+    print(f"\n{results['completed']}/{args.sessions} sessions completed in {monitor.wall_seconds:.1f}s "
+          f"at concurrency {args.concurrency} ({results['llm']}, documents: {results['documents']})")
+    print(f"Throughput: {results['throughput_sessions_per_minute']:.1f} sessions/min")
+    print(f"\n{'stage':<16}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    rows = list(results["stages"].items())
+    if results["session_latency"]:
+        rows.append(("session", results["session_latency"]))
+    for stage, stats in rows:
+        print(f"{stage:<16}{stats['count']:>7}" + "".join(f"{stats[k]:>9.2f}s" for k in ["p50", "p95", "p99", "max"]))
+    resources = results["resources"]
+    print(f"\nCPU: {resources['cpu_seconds']:.1f}s total, avg {resources['cpu_avg_percent']:.0f}%, "
+          f"peak {resources['cpu_peak_percent']:.0f}% of one core ({resources['cores']} cores)")
+    print(f"Memory: peak RSS {resources['rss_peak_mb']:.0f} MB ({resources['rss_source']})")
+    for error in errors[:5]:
+        print(f"Error: {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# Recognized lines below this confidence are left out of the text sent to the LLM
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", 0.5))
+
+# Two lines are on the same row when their vertical centers are within this fraction of the line height
+ROW_TOLERANCE = 0.5
+
+# Rows of at least this many cells, in a run of at least TABLE_MIN_ROWS, are treated as a table
+TABLE_MIN_COLUMNS = 3
+TABLE_MIN_ROWS = 2
+
+# An amount, score or percentage, optionally with a currency prefix or a "(Good)"-style note
+NUMBER_PATTERN = re.compile(
+    r"^(?:Rs\.?|INR|₹|\$|OMR|AED|EUR)?\s*(-?\d[\d,]*(?:\.\d+)?)\s*%?\s*(?:\([^)]*\))?$", re.IGNORECASE
+)
+
+
+class OCRLine:
+    """One recognized text line with its bounding box (x0, y0, x1, y1) and confidence."""
+
+    def __init__(self, text, confidence, box):
+        self.text = text.strip()
+        self.confidence = float(confidence)
+        self.x0, self.y0, self.x1, self.y1 = (float(v) for v in box)
+
+    @classmethod
+    def from_paddle(cls, line):
+        """From a PaddleOCR result line: `[[4 corner points], (text, confidence)]`."""
+        points = np.asarray(line[0], dtype="float64")
+        text, confidence = line[1]
+        return cls(text, confidence, (*points.min(axis=0), *points.max(axis=0)))
+
+    @property
+    def height(self):
+        return self.y1 - self.y0
+
+    @property
+    def center_y(self):
+        return (self.y0 + self.y1) / 2
+
+    def to_dict(self):
+        return {"text": self.text, "confidence": self.confidence, "box": [self.x0, self.y0, self.x1, self.y1]}
+
+    def __repr__(self):
+        return f"OCRLine({self.text!r}, {self.confidence:.2f}, ({self.x0:.0f}, {self.y0:.0f}, {self.x1:.0f}, {self.y1:.0f}))"
+
+
+def parse_number(text):
+    """The single number in a value like "Rs 1,20,000", "78%" or "750"; None otherwise."""
+    match = NUMBER_PATTERN.match(text or "")
+    return float(match.group(1).replace(",", "")) if match else None
+
+
+class OCRPage:
+    """Recognized lines of one page, with the layout reconstructed from their geometry.
+
+    Lines are grouped into visual rows (reading order is top-to-bottom, then
+    left-to-right), rows of "Label: value" or label/number pairs become key-value
+    pairs, and runs of rows with several aligned cells become tables.
+
+    Rows span the full page width: side-by-side columns of text are not separated,
+    so lines of two columns at the same height are read as one row. This suits the
+    single-column forms, IDs and tabular reports the app handles.
+    """
+
+    def __init__(self, lines, min_confidence=OCR_MIN_CONFIDENCE):
+        self.lines = [line for line in lines if line.text]
+        self.min_confidence = min_confidence
+        self._rows = None
+
+    @classmethod
+    def from_paddle(cls, result, **kwargs):
+        """From one page of `PaddleOCR.ocr` output (`result[0]`, which may be None)."""
+        return cls([OCRLine.from_paddle(line) for line in result or []], **kwargs)
+
+    @classmethod
+    def from_dicts(cls, lines, **kwargs):
+        """From `to_dicts()` output, e.g. a cached OCR result."""
+        return cls([OCRLine(line["text"], line["confidence"], line["box"]) for line in lines], **kwargs)
+
+    def to_dicts(self):
+        return [line.to_dict() for line in self.lines]
+
+    # **Reading order**
+    def rows(self):
+        """Confident lines grouped into rows, top to bottom, each sorted left to right.
+
+        Lines are grouped by vertical position only, across the whole page width.
+        """
+        if self._rows is None:
+            lines = sorted(
+                (line for line in self.lines if line.confidence >= self.min_confidence),
+                key=lambda line: line.center_y
+            )
+            rows = []
+            for line in lines:
+                row = rows[-1] if rows else None
+                if row is not None:
+                    row_center = sum(cell.center_y for cell in row) / len(row)
+                    row_height = max(cell.height for cell in row)
+                    if abs(line.center_y - row_center) <= ROW_TOLERANCE * max(row_height, line.height):
+                        row.append(line)
+                        continue
+                rows.append([line])
+            self._rows = [sorted(row, key=lambda cell: cell.x0) for row in rows]
+        return self._rows
+
+    def reading_order(self):
+        return [cell for row in self.rows() for cell in row]
+
+    # **Key-value pairs**
+    @staticmethod
+    def _row_key_value(row):
+        """(key, value) for "Key: value", "Key:" + value, or a text label followed by a number."""
+        if len(row) == 1:
+            key, sep, value = row[0].text.partition(":")
+            if sep and key.strip() and value.strip():
+                return key.strip(), value.strip()
+            return None
+        if len(row) == 2:
+            key, value = row[0].text, row[1].text
+            if key.endswith(":"):
+                return key.rstrip(": ").strip(), value
+            if not re.search(r"\d", key) and parse_number(value) is not None:
+                return key, value
+        return None
+
+    def key_values(self):
+        """Key-value pairs in reading order, outside of tables."""
+        table_rows = {id(row) for block in self._table_blocks() for row in block}
+        pairs = []
+        for row in self.rows():
+            if id(row) in table_rows:
+                continue
+            pair = self._row_key_value(row)
+            if pair:
+                pairs.append(pair)
+        return pairs
+
+    def numeric_fields(self):
+        """Key-value pairs whose value is a single number, e.g. {"Credit Score": 750.0}."""
+        fields = {}
+        for key, value in self.key_values():
+            number = parse_number(value)
+            if number is not None:
+                fields.setdefault(key, number)
+        return fields
+
+    # **Tables**
+    def _table_blocks(self):
+        """Runs of consecutive rows with enough cells to be a table."""
+        blocks, block = [], []
+        for row in self.rows():
+            if len(row) >= TABLE_MIN_COLUMNS:
+                block.append(row)
+                continue
+            if len(block) >= TABLE_MIN_ROWS:
+                blocks.append(block)
+            block = []
+        if len(block) >= TABLE_MIN_ROWS:
+            blocks.append(block)
+        return blocks
+
+    @staticmethod
+    def _table_frame(block):
+        """Aligns a block's cells into columns by horizontal overlap; the first row is the header."""
+        # Column spans start from the widest row and grow as cells are assigned to them
+        spans = [[cell.x0, cell.x1] for cell in max(block, key=len)]
+        grid = []
+        for row in block:
+            values = [""] * len(spans)
+            for cell in row:
+                overlaps = [min(cell.x1, x1) - max(cell.x0, x0) for x0, x1 in spans]
+                best = int(np.argmax(overlaps))
+                if overlaps[best] <= 0:
+                    # No overlap with any column: nearest column by center distance
+                    center = (cell.x0 + cell.x1) / 2
+                    best = int(np.argmin([abs(center - (x0 + x1) / 2) for x0, x1 in spans]))
+                spans[best] = [min(spans[best][0], cell.x0), max(spans[best][1], cell.x1)]
+                values[best] = f"{values[best]} {cell.text}".strip()
+            grid.append(values)
+
+        header = [name or f"Column {i + 1}" for i, name in enumerate(grid[0])]
+        if len(set(header)) < len(header):
+            header = [f"{name} ({i + 1})" for i, name in enumerate(header)]
+        return pd.DataFrame(grid[1:], columns=header)
+
+    def tables(self):
+        """Each table on the page as a DataFrame of strings (see `numeric_table` for numbers)."""
+        return [self._table_frame(block) for block in self._table_blocks()]
+
+    # **Compact text**
+    def to_text(self):
+        """Compact structured text in reading order: "Key: value" pairs, tables as pipe rows."""
+        table_starts = {id(block[0]): block for block in self._table_blocks()}
+        table_rows = {id(row) for block in table_starts.values() for row in block}
+
+        lines = []
+        for row in self.rows():
+            if id(row) in table_starts:
+                table = self._table_frame(table_starts[id(row)])
+                lines.append(" | ".join(table.columns))
+                lines.extend(" | ".join(values) for values in table.itertuples(index=False))
+                continue
+            if id(row) in table_rows:
+                continue
+            pair = self._row_key_value(row)
+            lines.append(f"{pair[0]}: {pair[1]}" if pair else " ".join(cell.text for cell in row))
+        return "\n".join(lines)
+
+
+def numeric_table(table):
+    """Converts the numeric-looking columns of a `tables()` DataFrame to floats."""
+    converted = table.copy()
+    for column in converted.columns:
+        numbers = converted[column].map(parse_number)
+        if numbers.notna().sum() >= max(1, (converted[column] != "").sum() // 2 + 1):
+            converted[column] = numbers
+    return converted
@@ -0,0 +1,137 @@
+import os
+import cv2
+import numpy as np
+
+# Images are downscaled so their longest edge is at most this many pixels (0 disables)
+OCR_MAX_LONG_EDGE = int(os.getenv("OCR_MAX_LONG_EDGE", 1600))
+
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "1") == "1"
+OCR_DESKEW = os.getenv("OCR_DESKEW", "1") == "1"
+
+# "" recognizes the whole page, "document" crops to the detected page/card,
+# "mrz" recognizes only a passport's machine-readable zone when one is found
+OCR_REGIONS = os.getenv("OCR_REGIONS", "")
+
+# Skew below this (degrees) is left alone; beyond MAX_SKEW_ANGLE the estimate is not trusted
+MIN_SKEW_ANGLE = 0.5
+MAX_SKEW_ANGLE = 15.0
+
+
+def cap_resolution(img, max_long_edge=OCR_MAX_LONG_EDGE):
+    """Downscales so the longest edge is at most `max_long_edge`; never upscales."""
+    height, width = img.shape[:2]
+    long_edge = max(height, width)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return img
+    scale = max_long_edge / long_edge
+    return cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def to_grayscale(img):
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def estimate_skew(gray):
+    """Estimates the page rotation in degrees from the median angle of near-horizontal lines."""
+    edges = cv2.Canny(gray, 50, 150)
+    min_length = max(gray.shape[1] // 8, 20)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 720, threshold=100, minLineLength=min_length, maxLineGap=10)
+    if lines is None:
+        return 0.0
+
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T.astype(np.float64)
+    angles = np.degrees(np.arctan2(y2 - y1, x2 - x1))
+    angles = angles[np.abs(angles) <= MAX_SKEW_ANGLE]
+    if angles.size == 0:
+        return 0.0
+    return float(np.median(angles))
+
+
+def deskew(img, angle):
+    """Rotates the image by `angle` degrees around its centre, keeping its size."""
+    if abs(angle) < MIN_SKEW_ANGLE:
+        return img
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def detect_document_region(gray):
+    """Bounding box (x, y, w, h) of the largest page/card-like contour, or None."""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(blurred, 50, 150), np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+
+    largest = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(largest)
+    # Too small to be the document, or already the whole frame: nothing worth cropping
+    if w * h < 0.2 * gray.size or w * h > 0.95 * gray.size:
+        return None
+    return x, y, w, h
+
+
+def detect_mrz_region(gray):
+    """Bounding box (x, y, w, h) of a passport machine-readable zone, or None.
+
+    MRZ lines are dense rows of dark OCR-B characters across most of the page width:
+    a blackhat transform highlights them, and closing merges them into one wide band.
+    """
+    height, width = gray.shape
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5)))
+    gradient = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+    gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    gradient = cv2.morphologyEx(gradient, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 7)))
+    _, thresh = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21)))
+    thresh = cv2.erode(thresh, None, iterations=2)
+
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        x, y, w, h = cv2.boundingRect(contour)
+        if w / max(h, 1) > 5 and w > 0.7 * width and y > height / 2:
+            # Pad so the outer characters aren't clipped
+            pad_x, pad_y = int(0.03 * width), int(0.3 * h)
+            x0, y0 = max(x - pad_x, 0), max(y - pad_y, 0)
+            x1, y1 = min(x + w + pad_x, width), min(y + h + pad_y, height)
+            return x0, y0, x1 - x0, y1 - y0
+    return None
+
+
+def _crop(img, box):
+    x, y, w, h = box
+    return img[y:y + h, x:x + w]
+
+
+def preprocess_for_ocr(img, max_long_edge=OCR_MAX_LONG_EDGE, grayscale=OCR_GRAYSCALE,
+                       deskew_image=OCR_DESKEW, regions=OCR_REGIONS):
+    """Prepares an image for recognition and returns the list of regions to OCR.
+
+    The image is capped in resolution first, so every later step works on the smaller
+    image. Whether this is faster end to end, and at what recall, is for benchmark_ocr.py
+    to show on real documents.
+    """
+    img = cap_resolution(img, max_long_edge)
+    gray = to_grayscale(img)
+    if grayscale:
+        img = gray
+
+    if deskew_image:
+        angle = estimate_skew(gray)
+        img = deskew(img, angle)
+        gray = deskew(gray, angle)
+
+    if regions in ("document", "mrz"):
+        box = detect_document_region(gray)
+        if box is not None:
+            img, gray = _crop(img, box), _crop(gray, box)
+
+    if regions == "mrz":
+        box = detect_mrz_region(gray)
+        if box is not None:
+            return [_crop(img, box)]
+
+    return [img]
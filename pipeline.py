@@ -0,0 +1,180 @@
+import hashlib
+import json
+from logger import logger
+from documents import as_document
+from generate_embeddings import (
+    FailedResult,
+    extract_text,
+    extract_numeric_fields,
+    summarize_sale_deed,
+    summarize_credit_report,
+    summarize_id_document,
+    aggregate_bank_statement,
+    summarize_bank_statement,
+    generate_final_profile,
+    query_document
+)
+
+# Documents whose text is extracted and summarized by the LLM
+TEXT_DOCUMENTS = ["Identification Document", "Sale Deed", "Credit Score Report"]
+
+# Documents whose extracted customer name is checked against the ID
+NAME_CHECK_DOCUMENTS = ["Sale Deed", "Credit Score Report"]
+
+
+def fingerprint_value(value):
+    """Returns the SHA-256 hex digest of a JSON-serializable value."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def is_failed_result(value):
+    """Whether a node's value is empty or a `FailedResult`; such values are never cached.
+
+    Tuples count as failed when every item is, e.g. `(FailedResult(...), None)`.
+    """
+    if value is None or isinstance(value, FailedResult):
+        return True
+    if isinstance(value, tuple):
+        return all(is_failed_result(item) for item in value)
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (dict, list)):
+        return not value
+    return False
+
+
+class DocumentPipeline:
+    """Dependency graph of the profiling pipeline with content-hash fingerprints.
+
+    Inputs (uploaded files, parameters) are fingerprinted by content. Every derived
+    node's fingerprint is the hash of its name and its dependencies' fingerprints, so
+    a node is recomputed only when something upstream of it actually changed.
+    """
+
+    def __init__(self):
+        self.inputs = {}  # name -> (value, fingerprint)
+        self.nodes = {}   # name -> (func, deps)
+        self.cache = {}   # name -> (fingerprint, value)
+
+    def set_input(self, name, value, fingerprint=None):
+        """Registers or replaces an input; `fingerprint` defaults to a hash of the value."""
+        if fingerprint is None:
+            fingerprint = fingerprint_value(value)
+        self.inputs[name] = (value, fingerprint)
+
+    def remove_input(self, name):
+        """Removes an input (e.g. a cleared upload) and the cached values that depended on it."""
+        self.inputs.pop(name, None)
+        for node in list(self.cache):
+            if not self.has(node):
+                del self.cache[node]
+
+    def add_node(self, name, func, deps):
+        """Registers a derived node computed as `func(*[value of each dep])`."""
+        self.nodes[name] = (func, deps)
+
+    def has(self, name):
+        """Whether every input upstream of `name` has been provided."""
+        if name in self.inputs:
+            return True
+        if name not in self.nodes:
+            return False
+        return all(self.has(dep) for dep in self.nodes[name][1])
+
+    def fingerprint(self, name):
+        if name in self.inputs:
+            return self.inputs[name][1]
+        _, deps = self.nodes[name]
+        digest = hashlib.sha256(name.encode("utf-8"))
+        for dep in deps:
+            digest.update(self.fingerprint(dep).encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_fresh(self, name):
+        """Whether `name` can be served from cache without recomputation."""
+        if name in self.inputs:
+            return True
+        cached = self.cache.get(name)
+        return cached is not None and cached[0] == self.fingerprint(name)
+
+    def get(self, name):
+        """Returns the value of `name`, recomputing it (and stale dependencies) only if needed.
+
+        Failed or empty results (see `is_failed_result`) are returned but not cached, so
+        the node is computed again on the next call instead of serving the failure.
+        """
+        if name in self.inputs:
+            return self.inputs[name][0]
+        if self.is_fresh(name):
+            return self.cache[name][1]
+
+        func, deps = self.nodes[name]
+        values = [self.get(dep) for dep in deps]
+        logger.info(f"Recomputing pipeline node: {name}")
+        value = func(*values)
+        if is_failed_result(value):
+            logger.warning(f"Pipeline node {name} failed or came back empty; not caching it")
+            self.cache.pop(name, None)
+        else:
+            self.cache[name] = (self.fingerprint(name), value)
+        return value
+
+
+def _whole_statement_metrics(aggregates):
+    view = aggregates.between() if aggregates is not None else None
+    return view.metrics() if view is not None and not view.empty else None
+
+
+def build_profile_pipeline():
+    """Builds the file -> text -> summary/metrics -> name checks -> final profile graph."""
+    pipeline = DocumentPipeline()
+
+    for doc_type in TEXT_DOCUMENTS:
+        pipeline.add_node(f"text:{doc_type}", extract_text, [f"file:{doc_type}"])
+
+    pipeline.add_node("identity", summarize_id_document, ["text:Identification Document"])
+    pipeline.add_node("summary:Sale Deed", summarize_sale_deed, ["text:Sale Deed"])
+    pipeline.add_node("summary:Credit Score Report", summarize_credit_report, ["text:Credit Score Report"])
+
+    # Scores and amounts read off the scanned report's layout, cross-checking the LLM summary
+    pipeline.add_node("fields:Credit Score Report", extract_numeric_fields, ["file:Credit Score Report"])
+
+    for doc_type in NAME_CHECK_DOCUMENTS:
+        pipeline.add_node(
+            f"name_check:{doc_type}",
+            lambda identity, text, doc_type=doc_type: query_document(identity, text, doc_type),
+            ["identity", f"text:{doc_type}"]
+        )
+
+    # Per-day aggregates of the statement; changing the time range only re-filters them
+    pipeline.add_node("bank_aggregates", aggregate_bank_statement, ["file:Bank Statement"])
+    pipeline.add_node("bank", summarize_bank_statement, ["bank_aggregates", "param:time_range"])
+    pipeline.set_input("param:time_range", "total")
+
+    # Whole-statement metrics for the portfolio store, independent of the selected time range
+    pipeline.add_node("bank_metrics", _whole_statement_metrics, ["bank_aggregates"])
+
+    # The final profile hangs off the collected summaries, so it is regenerated only
+    # when one of them changed, not whenever an unrelated upstream node was recomputed.
+    pipeline.add_node("final_profile", generate_final_profile, ["customer_profile"])
+
+    return pipeline
+
+
+def set_document_input(pipeline, doc_type, document):
+    """Registers an uploaded document (or file path), fingerprinted by its contents."""
+    document = as_document(document)
+    pipeline.set_input(f"file:{doc_type}", document, document.sha256)
+
+
+def collect_customer_profile(pipeline):
+    """Collects the summaries of every uploaded document, computing only stale ones."""
+    customer_profile = {}
+    for doc_type in ["Sale Deed", "Credit Score Report"]:
+        if pipeline.has(f"summary:{doc_type}"):
+            customer_profile[doc_type] = pipeline.get(f"summary:{doc_type}")
+    if pipeline.has("bank"):
+        customer_profile["Bank Statement"] = pipeline.get("bank")[0]
+
+    pipeline.set_input("customer_profile", customer_profile)
+    return customer_profile
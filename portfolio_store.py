@@ -0,0 +1,292 @@
+"""Portfolio-level store of completed customer profiles.
+
+Every profile finished in step 5 is appended as a row to a Parquet dataset partitioned
+by credit risk level. Within a partition, compaction sorts rows by estimated savings so
+Parquet row-group statistics act as a range index on it; together with the partition
+index this lets portfolio filters skip most of the data without touching documents or
+the LLM. Name search has no index: it is a substring match pushed into the scan, so it
+reads the name column of every partition it is not pruned from.
+
+Usage:
+    python portfolio_store.py query --risk Low --min-savings 10000
+    python portfolio_store.py query --name "john" --columns customer_name,estimated_savings
+    python portfolio_store.py compact
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from logger import logger
+
+PORTFOLIO_ROOT = os.getenv("PORTFOLIO_ROOT", "portfolio")
+
+RISK_LEVELS = ["Low", "Medium", "High", "Unknown"]
+
+SCHEMA = pa.schema([
+    ("customer_id", pa.string()),
+    ("profiled_at", pa.timestamp("us")),
+    ("customer_name", pa.string()),
+    ("date_of_birth", pa.string()),
+    ("id_number", pa.string()),
+    ("total_salary", pa.float64()),
+    ("total_expenditure", pa.float64()),
+    ("estimated_savings", pa.float64()),
+    ("total_investments", pa.float64()),
+    ("flagged_transactions", pa.int64()),
+    ("sale_amount", pa.float64()),
+    ("credit_risk_level", pa.string()),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([("credit_risk_level", pa.string())]), flavor="hive")
+
+# Field used to sort compacted partitions; its row-group min/max stats form the range index
+SORT_FIELD = "estimated_savings"
+ROW_GROUP_SIZE = 16_384
+
+# A partition is compacted once this many single-append files have accumulated
+COMPACT_AFTER_FILES = 64
+
+# One compaction per partition at a time; a lock older than this is left over from a crash
+COMPACT_LOCK_NAME = ".compact.lock"
+COMPACT_LOCK_STALE_SECONDS = 10 * 60
+
+# Reads that race a compaction (files listed, then removed) are retried this many times
+READ_ATTEMPTS = 3
+
+
+def _search(pattern, text):
+    match = re.search(pattern, text or "", re.IGNORECASE)
+    return match.group(1).strip(" *:-") if match else None
+
+
+def _field(label, text):
+    """Value after a "**Label:** value" style line in an LLM summary."""
+    return _search(rf"{label}[^:\n]*:\**\s*\**\s*([^\n]+)", text)
+
+
+def _amount(text):
+    if not text:
+        return None
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", text)
+    return float(match.group(0).replace(",", "")) if match else None
+
+
+def customer_key(id_number, fallback):
+    """Portfolio key of a customer: their normalized ID number, so re-profiling updates the same
+    customer; `fallback` (e.g. the session's customer id) when no ID number was extracted."""
+    normalized = re.sub(r"[^A-Z0-9]", "", (id_number or "").upper())
+    return f"ID-{normalized}" if normalized else fallback
+
+
+def profile_record(customer_id, identity_details, customer_profile, bank_metrics):
+    """Builds a portfolio row from a finished profile's summaries and bank metrics.
+
+    The row is keyed by the ID number parsed from the identity details when there is
+    one, so the same person profiled in different sessions is one portfolio customer.
+    """
+    id_number = _field("ID Number", identity_details) or _field("Passport Number", identity_details)
+    credit_summary = customer_profile.get("Credit Score Report", "")
+    risk_line = _field("Risk Level", credit_summary) or credit_summary
+    risk_level = _search(r"\b(Low|Medium|High)\b", risk_line)
+
+    record = {
+        "customer_id": customer_key(id_number, customer_id),
+        "profiled_at": pd.Timestamp.now(),
+        "customer_name": _field("Full Name", identity_details) or _field("Name", identity_details),
+        "date_of_birth": _field("Date of Birth", identity_details),
+        "id_number": id_number,
+        "sale_amount": _amount(_field("Sale Amount", customer_profile.get("Sale Deed", ""))),
+        "credit_risk_level": risk_level.capitalize() if risk_level else "Unknown",
+    }
+    for name in ["total_salary", "total_expenditure", "estimated_savings", "total_investments", "flagged_transactions"]:
+        record[name] = (bank_metrics or {}).get(name)
+    return record
+
+
+class PortfolioStore:
+    """Append-only Parquet dataset of customer profiles with partition and range indexes."""
+
+    def __init__(self, root=PORTFOLIO_ROOT):
+        self.root = root
+
+    def _partition_dir(self, risk_level):
+        return os.path.join(self.root, f"credit_risk_level={risk_level}")
+
+    def append(self, records):
+        """Appends one or more profile records; each call writes new files, never rewrites."""
+        if isinstance(records, dict):
+            records = [records]
+        df = pd.DataFrame(records)
+        df["credit_risk_level"] = df["credit_risk_level"].where(df["credit_risk_level"].isin(RISK_LEVELS), "Unknown")
+
+        for risk_level, rows in df.groupby("credit_risk_level"):
+            table = pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False).drop_columns(["credit_risk_level"])
+            partition_dir = self._partition_dir(risk_level)
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet")
+            pq.write_table(table, path)
+
+            if sum(name.endswith(".parquet") for name in os.listdir(partition_dir)) >= COMPACT_AFTER_FILES:
+                self.compact(risk_level)
+
+    def _read(self, **scan_options):
+        """Reads the dataset into pandas, rediscovering its files if a compaction removed some."""
+        for attempt in range(1, READ_ATTEMPTS + 1):
+            try:
+                return self.dataset().to_table(**scan_options).to_pandas()
+            except FileNotFoundError:
+                if attempt == READ_ATTEMPTS:
+                    raise
+
+    def _latest_keys(self):
+        """(customer_id, profiled_at) of each customer's latest profile, across all partitions."""
+        keys = self._read(columns=["customer_id", "profiled_at"])
+        return keys.sort_values("profiled_at").drop_duplicates("customer_id", keep="last")
+
+    def _lock_partition(self, partition_dir):
+        """Takes the partition's compaction lock file; returns its path, or None if it is held."""
+        path = os.path.join(partition_dir, COMPACT_LOCK_NAME)
+        try:
+            if time.time() - os.path.getmtime(path) > COMPACT_LOCK_STALE_SECONDS:
+                logger.warning(f"Removing stale compaction lock {path}")
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+        return path
+
+    def compact(self, risk_level=None):
+        """Merges a partition's files into one, sorted by SORT_FIELD.
+
+        Rows superseded by a newer profile of the same customer are dropped, including
+        when the newer profile landed in another risk partition. A partition whose lock
+        file is held by another compaction is skipped.
+        """
+        latest = self._latest_keys() if os.path.isdir(self.root) else None
+        for level in [risk_level] if risk_level else RISK_LEVELS:
+            partition_dir = self._partition_dir(level)
+            if not os.path.isdir(partition_dir):
+                continue
+            lock_path = self._lock_partition(partition_dir)
+            if lock_path is None:
+                logger.info(f"Skipping {partition_dir}: another compaction holds its lock")
+                continue
+            try:
+                self._compact_partition(partition_dir, latest)
+            finally:
+                os.remove(lock_path)
+
+    def _compact_partition(self, partition_dir, latest):
+        files = [os.path.join(partition_dir, name) for name in os.listdir(partition_dir) if name.endswith(".parquet")]
+        if not files:
+            return
+
+        try:
+            rows = ds.dataset(files, format="parquet").to_table().to_pandas()
+        except FileNotFoundError:
+            # Files removed since they were listed (e.g. by a compaction that held a stale lock)
+            logger.warning(f"Skipping {partition_dir}: its files changed during compaction")
+            return
+        df = rows.merge(latest, on=["customer_id", "profiled_at"]).drop_duplicates("customer_id")
+        if len(files) == 1 and len(df) == len(rows):
+            return  # Already a single file with only current profiles
+        df = df.sort_values(SORT_FIELD, na_position="first")
+
+        if not df.empty:
+            path = os.path.join(partition_dir, f"compacted-{time.time_ns()}.parquet")
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, row_group_size=ROW_GROUP_SIZE)
+        for old_file in files:
+            try:
+                os.remove(old_file)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Compacted {len(files)} files in {partition_dir}")
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", partitioning=PARTITIONING, schema=SCHEMA)
+
+    def query(self, risk_levels=None, min_savings=None, max_savings=None, name=None, columns=None, latest_only=True):
+        """Filters the portfolio, e.g. `query(risk_levels=["Low"], min_savings=10000)`.
+
+        Risk level prunes whole partitions; the savings range prunes row groups using
+        Parquet statistics, so only matching chunks are read. The name filter runs inside
+        the scan, but has no index to prune with. With `latest_only`, each
+        customer's latest profile is resolved first (from the key columns only) and the
+        filters apply to it, so an outdated profile never matches.
+        """
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns or SCHEMA.names)
+
+        conditions = []
+        if risk_levels:
+            conditions.append(ds.field("credit_risk_level").isin(list(risk_levels)))
+        if min_savings is not None:
+            conditions.append(ds.field("estimated_savings") >= min_savings)
+        if max_savings is not None:
+            conditions.append(ds.field("estimated_savings") <= max_savings)
+        if name:
+            conditions.append(pc.match_substring(ds.field("customer_name"), name, ignore_case=True))
+        condition = None
+        for expression in conditions:
+            condition = expression if condition is None else condition & expression
+
+        # customer_id/profiled_at are needed to match rows against each customer's latest profile
+        read_columns = None
+        if columns:
+            read_columns = list(dict.fromkeys(list(columns) + ["customer_id", "profiled_at", "customer_name"]))
+        df = self._read(columns=read_columns, filter=condition)
+
+        if latest_only and not df.empty:
+            df = df.merge(self._latest_keys(), on=["customer_id", "profiled_at"]).drop_duplicates("customer_id")
+        return df[columns] if columns else df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the customer portfolio store.")
+    parser.add_argument("--root", default=PORTFOLIO_ROOT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = commands.add_parser("query", help="Filter profiles")
+    query_parser.add_argument("--risk", action="append", choices=RISK_LEVELS, help="Credit risk level (repeatable)")
+    query_parser.add_argument("--min-savings", type=float)
+    query_parser.add_argument("--max-savings", type=float)
+    query_parser.add_argument("--name", help="Case-insensitive substring of the customer name")
+    query_parser.add_argument("--columns", help="Comma-separated columns to show")
+    query_parser.add_argument("--limit", type=int, default=50)
+
+    commands.add_parser("compact", help="Merge and sort partition files")
+
+    args = parser.parse_args()
+    store = PortfolioStore(args.root)
+
+    if args.command == "compact":
+        store.compact()
+        return 0
+
+    start = time.perf_counter()
+    df = store.query(
+        risk_levels=args.risk,
+        min_savings=args.min_savings,
+        max_savings=args.max_savings,
+        name=args.name,
+        columns=args.columns.split(",") if args.columns else None,
+    )
+    elapsed = time.perf_counter() - start
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(df.head(args.limit).to_string(index=False))
+    print(f"\n{len(df)} customers matched in {elapsed * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
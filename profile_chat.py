@@ -0,0 +1,99 @@
+import json
+import os
+import requests
+from logger import logger
+from generate_embeddings import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE
+from llm_resilience import LLMError, LLMResponseError, LLMTimeoutError, call_with_resilience
+
+# Ollama HTTP server used for multi-turn chat (the CLI in `run_ollama_model` is stateless)
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+# Most previous question/answer pairs replayed on a turn
+MAX_HISTORY_TURNS = 6
+
+# Turns dropped at once when the history is full; the replayed prefix changes only then
+HISTORY_TRIM_TURNS = 3
+
+
+class ProfileChatSession:
+    """Multi-turn Q&A over a single customer profile.
+
+    The profile is sent once, as the system message at the head of every request.
+    Because that prefix never changes, Ollama reuses its KV cache for it and only
+    the recent turns (bounded by `max_turns`) are evaluated on follow-up questions.
+
+    The history is trimmed a block of `trim_turns` at a time rather than sliding by
+    one turn, so between trims each request extends the previous one and Ollama
+    reuses the cached prefix for the earlier turns too.
+    """
+
+    def __init__(self, customer_profile, max_turns=MAX_HISTORY_TURNS, trim_turns=HISTORY_TRIM_TURNS):
+        self.system_prompt = f"""
+        You are an AI assistant for Relationship Managers. Using the following customer profile data, answer the questions concisely.
+        **Customer Profile:**
+        {json.dumps(customer_profile, indent=4)}
+        **Provide clear and precise responses.**
+        """
+        self.max_turns = max_turns
+        self.trim_turns = max(1, min(trim_turns, max_turns))
+        self.history = []  # [(question, answer), ...], at most `max_turns`, all replayed
+
+    def _messages(self, question):
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for past_question, past_answer in self.history:
+            messages.append({"role": "user", "content": past_question})
+            messages.append({"role": "assistant", "content": past_answer})
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def ask(self, question):
+        """Sends a question with the profile context and bounded history, returns the answer.
+
+        Raises an `LLMError` subclass if no answer could be produced; failed turns are
+        not added to the history.
+        """
+        def post(timeout):
+            try:
+                response = requests.post(
+                    f"{OLLAMA_HOST}/api/chat",
+                    json={
+                        "model": OLLAMA_MODEL,
+                        "messages": self._messages(question),
+                        "stream": False,
+                        "keep_alive": OLLAMA_KEEP_ALIVE,  # Keep the model and its cached prompt prefix resident
+                    },
+                    timeout=timeout,
+                )
+            except requests.Timeout:
+                raise LLMTimeoutError(f"Ollama chat did not answer within {timeout:.0f}s")
+            except requests.ConnectionError as e:
+                raise LLMResponseError(f"Ollama server unreachable: {e}")
+            except requests.RequestException as e:
+                raise LLMResponseError(f"Ollama chat request failed: {e}")
+
+            if response.status_code >= 400:
+                # Server-side errors and overload are worth retrying; bad requests are not
+                raise LLMResponseError(
+                    f"Ollama chat error {response.status_code}: {response.text.strip()}",
+                    transient=response.status_code >= 500 or response.status_code == 429
+                )
+            try:
+                answer = (response.json().get("message") or {}).get("content", "").strip()
+            except (ValueError, AttributeError, requests.RequestException) as e:
+                # Malformed JSON or a body cut off mid-stream
+                raise LLMResponseError(f"Ollama chat returned an unreadable response: {e}")
+            if not answer:
+                raise LLMResponseError("Ollama chat returned an empty response")
+            return answer
+
+        try:
+            answer = call_with_resilience(post, task="chat")
+        except LLMError as e:
+            logger.error(f"Error running profile chat: {e}")
+            raise
+
+        self.history.append((question, answer))
+        if len(self.history) > self.max_turns:
+            # Drop the oldest block at once, so the replayed prefix stays stable until the next trim
+            del self.history[:self.trim_turns]
+        return answer
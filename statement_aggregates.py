@@ -0,0 +1,194 @@
+"""Bank statement analysis in bounded memory.
+
+The parsed statement is never loaded as one frame. Each Parquet batch is reduced to small
+additive per-day aggregates (totals, merchant spend, recurring-payment and card partials)
+that are merged as batches arrive, so memory grows with days x merchants rather than with
+the number of transactions. A time range is then just a filter on the day index.
+
+Anomaly scoring is the one pass that needs every transaction: per-merchant baselines roll
+over each merchant's whole history in time order. It reads only `SCORING_COLUMNS` (with
+descriptions dictionary-encoded), roughly 40 bytes per transaction, and keeps per-day flag
+counts plus the most anomalous rows of each day.
+"""
+import numpy as np
+import pandas as pd
+from anomaly_detection import SCORING_COLUMNS, anomaly_partials, flagged_rows, score_transactions
+from statement_reader import STATEMENT_SCHEMA, iter_parsed_batches, read_statement
+from transaction_parser import (
+    CARD_PARTIAL_AGGREGATES,
+    RECURRING_PARTIAL_AGGREGATES,
+    SPEND_PARTIAL_AGGREGATES,
+    card_breakdown_from_partials,
+    card_partials,
+    recurring_partials,
+    recurring_payments_from_partials,
+    spend_partials,
+    top_merchants_from_partials
+)
+
+# Salary credits and investments are recognized by keywords in the description
+SALARY_PATTERN = "SALARY|PAYROLL"
+INVESTMENT_PATTERN = "MF|STOCK|BOND|FD|ETF|MUTUAL FUND|INVESTMENT"
+
+TOTAL_PARTIAL_AGGREGATES = {"Amount": "sum", "Salary": "sum", "Expenditure": "sum", "Investments": "sum"}
+
+# Partials of this many batches are merged at once, bounding the pending list
+MERGE_EVERY_BATCHES = 4
+
+# Stand-ins for a statement without rows, so empty aggregates keep their columns
+_EMPTY_STATEMENT = STATEMENT_SCHEMA.empty_table().to_pandas()
+_EMPTY_SCORED = score_transactions(_EMPTY_STATEMENT[SCORING_COLUMNS])
+
+
+def total_partials(df):
+    """Per-day amount total, salary credits, expenditure (debits) and investments."""
+    amount = df["TXN_AMOUNT_LCY"]
+    # Keywords are matched once per distinct description and broadcast back through the codes
+    codes, uniques = pd.factorize(df["TXN_DESC"])
+    uniques = pd.Series(np.append(np.asarray(uniques, dtype=object), ""))
+    codes = np.where(codes < 0, len(uniques) - 1, codes)
+    is_credit = (df["CR_DR_INDICATOR"] == "C").to_numpy()
+    is_debit = (df["CR_DR_INDICATOR"] == "D").to_numpy()
+    is_salary = uniques.str.contains(SALARY_PATTERN, case=False, na=False).to_numpy()[codes]
+    is_investment = uniques.str.contains(INVESTMENT_PATTERN, case=False, na=False).to_numpy()[codes]
+    return pd.DataFrame({
+        "DAY": df["TXN_DATE_TIME"].dt.normalize(),
+        "Amount": amount,
+        "Salary": amount.where(is_credit & is_salary, 0.0),
+        "Expenditure": amount.where(is_debit, 0.0),
+        "Investments": amount.where(is_investment, 0.0),
+    }).groupby("DAY").sum()
+
+
+# name -> (batch reducer, how its partials merge)
+PARTIALS = {
+    "totals": (total_partials, TOTAL_PARTIAL_AGGREGATES),
+    "spend": (spend_partials, SPEND_PARTIAL_AGGREGATES),
+    "recurring": (recurring_partials, RECURRING_PARTIAL_AGGREGATES),
+    "cards": (card_partials, CARD_PARTIAL_AGGREGATES),
+}
+
+
+def _merge(frames, aggregates):
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return None
+    merged = pd.concat(frames)
+    return merged.groupby(level=list(range(merged.index.nlevels)), observed=True, dropna=False).agg(aggregates)
+
+
+def _day_mask(day, start, end):
+    """Boolean mask of start <= day <= end (either bound may be None)."""
+    keep = np.ones(len(day), dtype=bool)
+    if start is not None:
+        keep &= np.asarray(day >= start)
+    if end is not None:
+        keep &= np.asarray(day <= end)
+    return keep
+
+
+def _between(partial, start, end):
+    """Rows of a DAY-indexed partial within the range."""
+    return partial[_day_mask(partial.index.get_level_values("DAY"), start, end)]
+
+
+class StatementAggregates:
+    """Per-day partial aggregates of a statement, folded in one batch at a time."""
+
+    def __init__(self):
+        self._pending = {name: [] for name in PARTIALS}
+        self._merged = {name: None for name in PARTIALS}
+        self.anomalies = None
+        self.flagged = None
+
+    def add(self, batch):
+        """Folds one batch of the parsed statement into the aggregates."""
+        for name, (reduce, _) in PARTIALS.items():
+            self._pending[name].append(reduce(batch))
+            if len(self._pending[name]) >= MERGE_EVERY_BATCHES:
+                self._flush(name)
+
+    def add_scores(self, scored):
+        """Records per-day flag counts and the flagged rows of a scored statement."""
+        self.anomalies = anomaly_partials(scored)
+        self.flagged = flagged_rows(scored)
+
+    def _flush(self, name):
+        frames = [self._merged[name]] if self._merged[name] is not None else []
+        self._merged[name] = _merge(frames + self._pending[name], PARTIALS[name][1])
+        self._pending[name] = []
+
+    def partial(self, name):
+        """The merged partials of `name` across all batches added so far."""
+        if self._pending[name]:
+            self._flush(name)
+        if self._merged[name] is None:
+            # No rows at all: an empty frame shaped like the batch reducer's output
+            return PARTIALS[name][0](_EMPTY_STATEMENT)
+        return self._merged[name]
+
+    @property
+    def first_day(self):
+        days = self.partial("totals").index
+        return days.min() if len(days) else None
+
+    def between(self, start=None, end=None):
+        """A view of the days from `start` to `end`, inclusive; None leaves that side open."""
+        return StatementView(self, start, end)
+
+
+class StatementView:
+    """The aggregates of a range of days, with the tables and metrics the app shows."""
+
+    def __init__(self, aggregates, start=None, end=None):
+        self.start, self.end = start, end
+        self.partials = {name: _between(aggregates.partial(name), start, end) for name in PARTIALS}
+        anomalies = aggregates.anomalies if aggregates.anomalies is not None else anomaly_partials(_EMPTY_SCORED)
+        flagged = aggregates.flagged if aggregates.flagged is not None else flagged_rows(_EMPTY_SCORED)
+        self._anomalies = _between(anomalies, start, end)
+        self._flagged = flagged[_day_mask(flagged["DAY"], start, end)]
+
+    @property
+    def empty(self):
+        return self.partials["totals"].empty
+
+    def metrics(self):
+        """Headline metrics: salary, expenditure, estimated savings, investments and flagged count."""
+        totals = self.partials["totals"].sum()
+        return {
+            "total_salary": float(totals.get("Salary", 0.0)),
+            "total_expenditure": float(totals.get("Expenditure", 0.0)),
+            # Estimated Savings: Salary - Expenditure
+            "estimated_savings": float(totals.get("Salary", 0.0) - totals.get("Expenditure", 0.0)),
+            "total_investments": float(totals.get("Investments", 0.0)),
+            "flagged_transactions": int(self._anomalies["Flagged"].sum()),
+        }
+
+    def daily_totals(self):
+        """Sum of transaction amounts per day."""
+        return self.partials["totals"]["Amount"]
+
+    def anomaly_counts(self):
+        return self._anomalies.sum()
+
+    def flagged_transactions(self):
+        """Flagged transactions, most anomalous first (at most FLAGGED_ROWS_PER_DAY per day)."""
+        return self._flagged.sort_values("ANOMALY_ZSCORE", ascending=False).drop(columns="DAY")
+
+    def top_merchants(self, n=10):
+        return top_merchants_from_partials(self.partials["spend"], n)
+
+    def recurring_payments(self):
+        return recurring_payments_from_partials(self.partials["recurring"])
+
+    def card_breakdown(self):
+        return card_breakdown_from_partials(self.partials["cards"])
+
+
+def aggregate_statement(file_path):
+    """Aggregates a bank statement batch by batch and scores its transactions for anomalies."""
+    aggregates = StatementAggregates()
+    for batch in iter_parsed_batches(file_path):
+        aggregates.add(batch)
+    aggregates.add_scores(score_transactions(read_statement(file_path, columns=SCORING_COLUMNS)))
+    return aggregates
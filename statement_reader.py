@@ -0,0 +1,236 @@
+import re
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from logger import logger
+from documents import as_document
+from document_store import get_store
+from transaction_parser import PARSED_COLUMNS, PARSED_CATEGORICAL_COLUMNS, parse_transactions
+
+# Columns of the bank statement schema used throughout the app
+STATEMENT_COLUMNS = [
+    "ACCOUNT_CCY", "TXN_CODE", "TXN_DESC", "CR_DR_INDICATOR", "TXN_DATE_TIME",
+    "TXN_AMOUNT_LCY", "TXN_AMOUNT_FCY", "TXN_CCY", "SOURCE_SYSTEM"
+]
+REQUIRED_COLUMNS = {"CR_DR_INDICATOR", "TXN_AMOUNT_LCY", "TXN_DATE_TIME", "TXN_DESC"}
+
+# A header row must name these; the debit/credit indicator can be derived from signed amounts
+HEADER_COLUMNS = {"TXN_AMOUNT_LCY", "TXN_DATE_TIME", "TXN_DESC"}
+
+# Header names seen in bank exports, normalized (see `normalize_column`), mapped to the schema
+COLUMN_ALIASES = {
+    "DESCRIPTION": "TXN_DESC",
+    "NARRATION": "TXN_DESC",
+    "PARTICULARS": "TXN_DESC",
+    "TRANSACTION_DETAILS": "TXN_DESC",
+    "DETAILS": "TXN_DESC",
+    "CR_DR": "CR_DR_INDICATOR",
+    "DR_CR": "CR_DR_INDICATOR",
+    "DEBIT_CREDIT": "CR_DR_INDICATOR",
+    "TYPE": "CR_DR_INDICATOR",
+    "DATE": "TXN_DATE_TIME",
+    "TXN_DATE": "TXN_DATE_TIME",
+    "TRANSACTION_DATE": "TXN_DATE_TIME",
+    "VALUE_DATE": "TXN_DATE_TIME",
+    "AMOUNT": "TXN_AMOUNT_LCY",
+    "TXN_AMOUNT": "TXN_AMOUNT_LCY",
+    "TRANSACTION_AMOUNT": "TXN_AMOUNT_LCY",
+    "CURRENCY": "TXN_CCY",
+}
+
+# Low-cardinality columns stored as categoricals to keep large statements compact
+CATEGORICAL_COLUMNS = ["ACCOUNT_CCY", "TXN_CODE", "CR_DR_INDICATOR", "TXN_CCY", "SOURCE_SYSTEM"]
+
+# Rows per batch yielded by `iter_statement_batches`
+BATCH_SIZE = 50_000
+
+# Store artifact holding the conformed, parsed statement; renamed whenever its columns change
+STATEMENT_ARTIFACT = "statement-v3.parquet"
+
+# Spreadsheet exports often start with a title block; look this far down for the header row
+HEADER_SEARCH_ROWS = 20
+
+
+def _column_type(column):
+    """Arrow type of a column in the statement artifact."""
+    if column in CATEGORICAL_COLUMNS or column in PARSED_CATEGORICAL_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if column in ("TXN_DATE_TIME", "TXN_LOCAL_TIME"):
+        return pa.timestamp("ns")
+    if column in ("TXN_AMOUNT_LCY", "TXN_AMOUNT_FCY"):
+        return pa.float64()
+    return pa.string()
+
+
+# Fixed Parquet schema of the artifact, so batches with differing columns or categories
+# (e.g. sheets with different headers) append to one file; missing columns are null
+STATEMENT_SCHEMA = pa.schema([(column, _column_type(column)) for column in STATEMENT_COLUMNS + PARSED_COLUMNS])
+
+
+def normalize_column(name):
+    """Upper-cases a header and collapses anything non-alphanumeric to underscores."""
+    return re.sub(r"[^A-Z0-9]+", "_", str(name).strip().upper()).strip("_")
+
+
+def map_columns(columns):
+    """Maps raw header names to schema columns; unknown columns are left out."""
+    mapping = {}
+    for column in columns:
+        if column is None:
+            continue
+        normalized = normalize_column(column)
+        target = normalized if normalized in STATEMENT_COLUMNS else COLUMN_ALIASES.get(normalized)
+        if target and target not in mapping.values():
+            mapping[column] = target
+    return mapping
+
+
+def conform_batch(df):
+    """Renames a raw batch to the statement schema and applies compact dtypes."""
+    df = df.rename(columns=map_columns(df.columns))
+    df = df[[column for column in STATEMENT_COLUMNS if column in df.columns]].copy()
+
+    if "TXN_AMOUNT_LCY" in df.columns:
+        df["TXN_AMOUNT_LCY"] = pd.to_numeric(df["TXN_AMOUNT_LCY"], errors="coerce")
+        # Exports without a debit/credit column carry the direction in the amount's sign
+        if "CR_DR_INDICATOR" not in df.columns:
+            df["CR_DR_INDICATOR"] = df["TXN_AMOUNT_LCY"].lt(0).map({True: "D", False: "C"})
+            df["TXN_AMOUNT_LCY"] = df["TXN_AMOUNT_LCY"].abs()
+
+    if "CR_DR_INDICATOR" in df.columns:
+        # "Debit"/"DR"/"D" -> "D", "Credit"/"CR"/"C" -> "C"
+        df["CR_DR_INDICATOR"] = df["CR_DR_INDICATOR"].astype("string").str.strip().str[0].str.upper()
+
+    if "TXN_DATE_TIME" in df.columns:
+        df["TXN_DATE_TIME"] = pd.to_datetime(df["TXN_DATE_TIME"], errors="coerce")
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+
+    return df
+
+
+def _iter_csv_batches(document, batch_size):
+    with document.open() as f:
+        for chunk in pd.read_csv(f, chunksize=batch_size, usecols=lambda column: column in map_columns([column])):
+            yield conform_batch(chunk)
+
+
+def _iter_xlsx_batches(document, batch_size):
+    """Streams every sheet of a workbook in read-only mode, one batch of rows at a time."""
+    from openpyxl import load_workbook
+
+    f = document.open()
+    workbook = load_workbook(f, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+
+            # Find the header row: the first one that maps onto the core statement columns
+            header = None
+            for _, row in zip(range(HEADER_SEARCH_ROWS), rows):
+                if HEADER_COLUMNS.issubset(map_columns(row).values()):
+                    header = row
+                    break
+            if header is None:
+                logger.warning(f"Skipping sheet '{sheet.title}' in {document.name}: no statement header found")
+                continue
+
+            # Keep only the mapped columns of each row so unused cells are never materialized
+            mapping = map_columns(header)
+            positions = [i for i, column in enumerate(header) if column in mapping]
+            names = [header[i] for i in positions]
+
+            batch = []
+            for row in rows:
+                if not any(cell is not None for cell in row):
+                    continue
+                batch.append([row[i] if i < len(row) else None for i in positions])
+                if len(batch) >= batch_size:
+                    yield conform_batch(pd.DataFrame(batch, columns=names))
+                    batch = []
+            if batch:
+                yield conform_batch(pd.DataFrame(batch, columns=names))
+    finally:
+        workbook.close()
+        f.close()
+
+
+def iter_statement_batches(file_path, batch_size=BATCH_SIZE):
+    """Yields the statement as schema-conformed DataFrame batches, dispatching on the file format.
+
+    Accepts a filesystem path or an `InMemoryDocument` upload.
+    """
+    document = as_document(file_path)
+    if document.extension == "csv":
+        return _iter_csv_batches(document, batch_size)
+    if document.extension == "xlsx":
+        return _iter_xlsx_batches(document, batch_size)
+    raise ValueError(f"Unsupported bank statement format: {document.name}")
+
+
+def _to_arrow(df):
+    """Converts a parsed batch to STATEMENT_SCHEMA."""
+    arrays = []
+    for field in STATEMENT_SCHEMA:
+        if field.name not in df.columns:
+            arrays.append(pa.nulls(len(df), field.type))
+            continue
+        column = df[field.name]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(column.astype("string"), type=pa.string()).dictionary_encode())
+        elif pa.types.is_timestamp(field.type):
+            arrays.append(pa.array(pd.to_datetime(column, errors="coerce"), type=field.type))
+        elif pa.types.is_floating(field.type):
+            arrays.append(pa.array(pd.to_numeric(column, errors="coerce"), type=field.type))
+        else:
+            arrays.append(pa.array(column.astype("string"), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=STATEMENT_SCHEMA)
+
+
+def _build_statement_artifact(document, batch_size):
+    """Parses the statement batch by batch into a Parquet artifact; one batch is in memory at a time."""
+    store = get_store()
+    rows = 0
+    with store.writing_artifact(document.sha256, STATEMENT_ARTIFACT) as path:
+        with pq.ParquetWriter(path, STATEMENT_SCHEMA) as writer:
+            for batch in iter_statement_batches(document, batch_size):
+                missing = REQUIRED_COLUMNS - set(batch.columns)
+                if missing:
+                    raise ValueError(f"Missing required columns: {missing}")
+                writer.write_table(_to_arrow(parse_transactions(batch)))
+                rows += len(batch)
+        if not rows:
+            raise ValueError(f"No bank statement rows found in {document.name}")
+    return store.find_artifact(document.sha256, STATEMENT_ARTIFACT)
+
+
+def statement_path(file_path, batch_size=BATCH_SIZE):
+    """Path of the parsed statement's Parquet artifact, building it on first use.
+
+    `TXN_DESC` is split into structured merchant/card fields (see `parse_transactions`).
+    The artifact is keyed by the statement's content hash, so a given statement is
+    only parsed once; categorical columns are stored dictionary-encoded.
+    """
+    document = as_document(file_path)
+    path = get_store().find_artifact(document.sha256, STATEMENT_ARTIFACT)
+    return path or _build_statement_artifact(document, batch_size)
+
+
+def iter_parsed_batches(file_path, columns=None, batch_size=BATCH_SIZE):
+    """Yields the parsed statement in batches of at most `batch_size` rows, in file order."""
+    parquet = pq.ParquetFile(statement_path(file_path, batch_size))
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def read_statement(file_path, columns=None, batch_size=BATCH_SIZE):
+    """Reads the parsed statement (or just `columns` of it) into one DataFrame.
+
+    The whole statement is held in memory, so prefer `iter_parsed_batches` and read
+    only the columns needed. `TXN_DESC` is returned as a categorical.
+    """
+    return pq.read_table(
+        statement_path(file_path, batch_size), columns=columns, read_dictionary=["TXN_DESC"]
+    ).to_pandas()
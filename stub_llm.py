@@ -0,0 +1,145 @@
+"""Local stand-in for Ollama with injectable latency and failures.
+
+Speaks both interfaces the app uses, so the full flow (and its timeouts, retries and
+circuit breaker) can be exercised without a model:
+
+    # CLI, used by run_ollama_model
+    OLLAMA_COMMAND="python stub_llm.py" streamlit run app.py
+
+    # HTTP API, used by the profile chat
+    python stub_llm.py serve --port 11435
+    OLLAMA_HOST=http://localhost:11435 streamlit run app.py
+
+Behaviour is controlled with environment variables:
+    STUB_LLM_LATENCY       mean seconds per response (default 0.2)
+    STUB_LLM_JITTER        +/- uniform jitter in seconds (default 0.1)
+    STUB_LLM_FAILURE_RATE  probability of an error response (default 0)
+    STUB_LLM_HANG_RATE     probability of never answering within STUB_LLM_HANG_SECONDS (default 0)
+    STUB_LLM_HANG_SECONDS  how long a hung response blocks (default 600)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_LATENCY = float(os.getenv("STUB_LLM_LATENCY", 0.2))
+STUB_JITTER = float(os.getenv("STUB_LLM_JITTER", 0.1))
+STUB_FAILURE_RATE = float(os.getenv("STUB_LLM_FAILURE_RATE", 0))
+STUB_HANG_RATE = float(os.getenv("STUB_LLM_HANG_RATE", 0))
+STUB_HANG_SECONDS = float(os.getenv("STUB_LLM_HANG_SECONDS", 600))
+
+PROFILE_SECTIONS = [
+    "Customer Identity & Property Ownership",
+    "Creditworthiness & Loan Eligibility",
+    "Financial Stability & Spending Behavior",
+    "Potential Risks & Red Flags",
+    "Recommendations for Banking Products",
+]
+SECTION_MARKERS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣"]
+
+
+def stub_response(prompt):
+    """Plausible output for the app's prompts: a YES for name checks, five sections for profiles."""
+    if "YES" in prompt and "NO" in prompt:
+        return "YES"
+    if "1️⃣" in prompt:
+        return "\n".join(
+            f"{marker} **{title}**\nStub assessment for {title.lower()}."
+            for marker, title in zip(SECTION_MARKERS, PROFILE_SECTIONS)
+        )
+    return (
+        "**Full Name:** Stub Customer\n"
+        "**Date of Birth:** 01/01/1990\n"
+        "**ID Number:** X0000000\n"
+        "**Risk Level:** Low\n"
+        "**Sale Amount:** 1,000,000\n"
+        f"Stub summary of a {len(prompt)}-character prompt."
+    )
+
+
+def simulate():
+    """Sleeps for the configured latency; returns False if this response should fail."""
+    if random.random() < STUB_HANG_RATE:
+        time.sleep(STUB_HANG_SECONDS)
+    time.sleep(max(0.0, STUB_LATENCY + random.uniform(-STUB_JITTER, STUB_JITTER)))
+    return random.random() >= STUB_FAILURE_RATE
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "stub"}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "stub")
+
+        if self.path == "/api/chat":
+            prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+        elif self.path == "/api/generate":
+            prompt = request.get("prompt", "")
+        else:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if not simulate():
+            self._send_json(503, {"error": "stub: injected failure"})
+            return
+
+        answer = stub_response(prompt) if prompt else ""
+        if self.path == "/api/chat":
+            self._send_json(200, {"model": model, "message": {"role": "assistant", "content": answer}, "done": True})
+        else:
+            self._send_json(200, {"model": model, "response": answer, "done": True})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama CLI/server with injectable latency and failures.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Answer the prompt on stdin, like `ollama run <model>`")
+    run_parser.add_argument("model")
+    run_parser.add_argument("--keepalive", help="Accepted for compatibility; ignored")
+
+    serve_parser = commands.add_parser("serve", help="Serve /api/chat, /api/generate and /api/tags")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=11435)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        prompt = sys.stdin.read()
+        if not simulate():
+            print("Error: stub: injected failure", file=sys.stderr)
+            return 1
+        print(stub_response(prompt))
+        return 0
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Amount outlier, duplicate and velocity-burst flags (anomaly_detection.py).
+
+Run with `python -m pytest -q test_anomaly_detection.py`.
+"""
+import pandas as pd
+from anomaly_detection import (
+    MIN_OUTLIER_AMOUNT,
+    ROLLING_MIN_PERIODS,
+    VELOCITY_MIN_COUNT,
+    score_transactions
+)
+
+
+def statement(rows):
+    """(time, description, amount[, indicator]) tuples as a statement frame."""
+    df = pd.DataFrame(
+        [row if len(row) == 4 else (*row, "D") for row in rows],
+        columns=["TXN_DATE_TIME", "TXN_DESC", "TXN_AMOUNT_LCY", "CR_DR_INDICATOR"]
+    )
+    df["TXN_DATE_TIME"] = pd.to_datetime(df["TXN_DATE_TIME"])
+    return df
+
+
+def regular_spend(description, amounts, start="2024-06-01 09:00"):
+    """One debit a day at `description`, at slightly varying clock times."""
+    start = pd.Timestamp(start)
+    return [
+        (start + pd.Timedelta(days=day, minutes=7 * day), description, amount)
+        for day, amount in enumerate(amounts)
+    ]
+
+
+def test_large_jump_at_a_regular_merchant_is_an_outlier():
+    rows = regular_spend("UTILITY PAYMENT", [200.0, 210.0, 190.0, 205.0, 195.0, 200.0, 2500.0])
+    scored = score_transactions(statement(rows))
+
+    assert scored["IS_AMOUNT_OUTLIER"].tolist() == [False] * 6 + [True]
+    assert scored["IS_ANOMALY"].iloc[-1]
+
+
+def test_trivial_amounts_are_not_outliers_however_high_their_z():
+    # Rs 5.90 after a run of Rs 1.00 coffees: a large z-score on the log scale, but immaterial
+    rows = regular_spend("ONS POS COFFEE", [1.0] * 8 + [5.9])
+    scored = score_transactions(statement(rows))
+
+    assert scored["ANOMALY_ZSCORE"].iloc[-1] > 3.5
+    assert not scored["IS_AMOUNT_OUTLIER"].any()
+
+
+def test_small_deviation_above_the_floor_is_not_an_outlier():
+    # Over MIN_OUTLIER_AMOUNT, but only a few units above a very regular baseline
+    rows = regular_spend("GYM MEMBERSHIP", [MIN_OUTLIER_AMOUNT] * 8 + [MIN_OUTLIER_AMOUNT + 20])
+    scored = score_transactions(statement(rows))
+
+    assert scored["ANOMALY_ZSCORE"].iloc[-1] > 3.5
+    assert not scored["IS_AMOUNT_OUTLIER"].any()
+
+
+def test_a_transaction_does_not_dampen_its_own_baseline():
+    amounts = [100.0] * ROLLING_MIN_PERIODS + [3000.0]
+    scored = score_transactions(statement(regular_spend("RENT", amounts)))
+
+    assert scored["IS_AMOUNT_OUTLIER"].iloc[-1]
+
+
+def test_repeated_charge_on_the_same_day_is_a_duplicate():
+    rows = [
+        ("2024-06-01 10:00", "ONLINE STORE 123", 49.99),
+        ("2024-06-01 18:30", "ONLINE STORE 123", 49.99),
+        ("2024-06-02 10:00", "ONLINE STORE 123", 49.99),
+    ]
+    scored = score_transactions(statement(rows))
+
+    assert scored["IS_DUPLICATE"].tolist() == [False, True, False]
+
+
+def test_rapid_card_debits_are_a_velocity_burst():
+    start = pd.Timestamp("2024-06-01 12:00")
+    rows = [(start + pd.Timedelta(minutes=i), f"ONS POS,{i},SHOP{i}", 10.0 + i) for i in range(VELOCITY_MIN_COUNT)]
+    rows.append((start + pd.Timedelta(hours=5), "ONS POS,99,SHOP99", 12.0))
+    scored = score_transactions(statement(rows))
+
+    assert scored["VELOCITY_COUNT"].tolist()[:VELOCITY_MIN_COUNT] == list(range(1, VELOCITY_MIN_COUNT + 1))
+    assert scored["IS_VELOCITY_BURST"].tolist() == [False] * (VELOCITY_MIN_COUNT - 1) + [True, False]
+
+
+def test_spread_out_card_debits_are_not_a_burst():
+    start = pd.Timestamp("2024-06-01 08:00")
+    rows = [(start + pd.Timedelta(minutes=30 * i), f"ONS POS,{i},SHOP{i}", 10.0) for i in range(VELOCITY_MIN_COUNT + 2)]
+    scored = score_transactions(statement(rows))
+
+    assert not scored["IS_VELOCITY_BURST"].any()
+
+
+def test_batch_posting_times_never_form_a_burst():
+    # Every posting at midnight: the clock time carries no information about when cards were used
+    rows = [(pd.Timestamp("2024-06-01"), f"ONS POS,{i},SHOP{i}", 10.0 + i) for i in range(VELOCITY_MIN_COUNT + 2)]
+    scored = score_transactions(statement(rows))
+
+    assert not scored["IS_VELOCITY_BURST"].any()
+
+
+def test_empty_statement_gets_the_flag_columns():
+    scored = score_transactions(statement([]))
+
+    assert scored.empty
+    assert {"ANOMALY_ZSCORE", "IS_AMOUNT_OUTLIER", "IS_DUPLICATE", "IS_VELOCITY_BURST", "IS_ANOMALY"} <= set(scored.columns)
@@ -0,0 +1,112 @@
+"""Eviction in the content-addressed document store (document_store.py).
+
+Run with `python -m pytest -q test_document_store.py`.
+"""
+import os
+import time
+import pytest
+from document_store import DocumentStore
+
+TTL = 60
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DocumentStore(root=str(tmp_path), ttl_seconds=TTL, max_bytes=10 ** 9)
+
+
+def put(store, name):
+    digest = name * 64
+    store.put(name.encode("ascii") * 100, digest)
+    store.put_artifact(digest, "text-v2", b"extracted")
+    return digest
+
+
+def age(path, seconds):
+    """Backdates a file's mtime, as if it had not been used for `seconds`."""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def age_document(store, digest, seconds):
+    age(store.blob_path(digest), seconds)
+    age(store.artifact_path(digest, "text-v2"), seconds)
+
+
+def test_expired_unreferenced_documents_are_evicted(store):
+    digest = put(store, "a")
+    age_document(store, digest, 2 * TTL)
+
+    assert store.evict() == 1
+    assert not store.has(digest)
+    assert store.get_artifact(digest, "text-v2") is None
+
+
+def test_referenced_documents_are_kept(store):
+    digest = put(store, "a")
+    store.add_reference("session", "customer", "Sale Deed", digest, "deed.pdf")
+    age_document(store, digest, 2 * TTL)
+
+    assert store.evict() == 0
+    assert store.has(digest)
+    assert store.get_artifact(digest, "text-v2") == b"extracted"
+
+
+def test_released_references_make_documents_evictable(store):
+    digest = put(store, "a")
+    store.add_reference("session", "customer", "Sale Deed", digest, "deed.pdf")
+    store.release("session", "customer")
+    age_document(store, digest, 2 * TTL)
+
+    assert store.evict() == 1
+
+
+def test_touched_references_outlive_the_ttl(store):
+    digest = put(store, "a")
+    store.add_reference("session", "customer", "Sale Deed", digest, "deed.pdf")
+    ref_path = store._ref_path("session", "customer")
+    age(ref_path, 2 * TTL)
+    age_document(store, digest, 2 * TTL)
+
+    # An active session renews its references on every use
+    store.touch_references("session", "customer")
+    assert store.evict() == 0
+    assert store.has(digest)
+
+    # An idle one's references expire, and its documents with them
+    age(ref_path, 2 * TTL)
+    assert store.evict() == 1
+    assert not os.path.exists(ref_path)
+
+
+def test_leased_documents_are_kept_until_released(store):
+    digest = put(store, "a")
+    store.lease(digest)
+    age_document(store, digest, 2 * TTL)
+
+    assert store.evict() == 0
+    store.release_lease(digest)
+    assert store.evict() == 1
+
+
+def test_over_budget_evicts_least_recently_used_unreferenced_first(tmp_path):
+    store = DocumentStore(root=str(tmp_path), ttl_seconds=TTL, max_bytes=250)
+    oldest, older, referenced = put(store, "a"), put(store, "b"), put(store, "c")
+    store.add_reference("session", "customer", "Sale Deed", referenced, "deed.pdf")
+    age_document(store, referenced, 30)
+    age_document(store, oldest, 20)
+    age_document(store, older, 10)
+
+    # Three documents of 109 bytes each: dropping the oldest unreferenced one is enough
+    assert store.evict() == 1
+    assert not store.has(oldest)
+    assert store.has(older) and store.has(referenced)
+
+
+def test_put_document_writes_the_buffer(store):
+    from documents import InMemoryDocument
+
+    document = InMemoryDocument("statement.csv", bytearray(b"TXN_DESC,TXN_AMOUNT_LCY\nSHELL,10\n"))
+    store.put_document(document)
+    with open(store.blob_path(document.sha256), "rb") as f:
+        assert f.read() == b"TXN_DESC,TXN_AMOUNT_LCY\nSHELL,10\n"
@@ -0,0 +1,218 @@
+"""Retries, deadlines and the circuit breaker, driven through the stub LLM (stub_llm.py).
+
+Run with `python -m pytest -q test_llm_resilience.py`.
+"""
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import pytest
+import generate_embeddings
+import profile_chat
+import stub_llm
+from llm_resilience import (
+    LLM_DEADLINES,
+    LLM_MAX_ATTEMPTS,
+    CircuitBreaker,
+    LLMResponseError,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    breaker,
+    call_with_resilience
+)
+
+
+@pytest.fixture(autouse=True)
+def closed_breaker():
+    """Each test starts and ends with the shared breaker closed."""
+    breaker.record_success()
+    yield
+    breaker.record_success()
+
+
+@pytest.fixture
+def stub_cli(monkeypatch):
+    """Points `run_ollama_model` at the stub CLI with no latency."""
+    monkeypatch.setattr(generate_embeddings, "OLLAMA_COMMAND", [sys.executable, stub_llm.__file__])
+    monkeypatch.setenv("STUB_LLM_LATENCY", "0")
+    monkeypatch.setenv("STUB_LLM_JITTER", "0")
+    monkeypatch.setenv("STUB_LLM_FAILURE_RATE", "0")
+    return monkeypatch
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    """Runs the stub HTTP API in-process and points the profile chat at it."""
+    monkeypatch.setattr(stub_llm, "STUB_LATENCY", 0.0)
+    monkeypatch.setattr(stub_llm, "STUB_JITTER", 0.0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_llm.StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(profile_chat, "OLLAMA_HOST", f"http://127.0.0.1:{server.server_address[1]}")
+    yield monkeypatch
+    server.shutdown()
+    server.server_close()
+
+
+def test_transient_errors_are_retried():
+    calls = []
+
+    def flaky(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise LLMResponseError("overloaded")
+        return "ok"
+
+    assert call_with_resilience(flaky, deadline=30, max_attempts=3, circuit=CircuitBreaker()) == "ok"
+    assert len(calls) == 3
+
+
+def test_permanent_errors_are_not_retried():
+    calls = []
+
+    def bad_request(timeout):
+        calls.append(timeout)
+        raise LLMResponseError("bad request", transient=False)
+
+    with pytest.raises(LLMResponseError):
+        call_with_resilience(bad_request, deadline=30, max_attempts=3, circuit=CircuitBreaker())
+    assert len(calls) == 1
+
+
+def test_breaker_opens_fails_fast_and_recovers():
+    circuit = CircuitBreaker(failure_threshold=2, reset_seconds=0.2)
+
+    def failing(timeout):
+        raise LLMTimeoutError("no answer")
+
+    for _ in range(2):
+        with pytest.raises(LLMTimeoutError):
+            call_with_resilience(failing, deadline=5, max_attempts=1, circuit=circuit)
+    assert circuit.state == "open"
+    with pytest.raises(LLMUnavailableError):
+        call_with_resilience(lambda timeout: "ok", deadline=5, circuit=circuit)
+
+    time.sleep(0.25)
+    assert circuit.state == "half-open"
+    assert call_with_resilience(lambda timeout: "ok", deadline=5, circuit=circuit) == "ok"
+    assert circuit.state == "closed"
+
+
+def test_rejected_requests_do_not_open_the_breaker():
+    circuit = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+
+    def bad_request(timeout):
+        raise LLMResponseError("400 Bad Request", transient=False)
+
+    for _ in range(3):
+        with pytest.raises(LLMResponseError):
+            call_with_resilience(bad_request, deadline=5, circuit=circuit)
+    assert circuit.state == "closed"
+    assert circuit.failures == 0
+
+
+def test_rejected_half_open_trial_lets_the_next_call_through():
+    circuit = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+    circuit.record_failure()
+    time.sleep(0.15)
+
+    def bad_request(timeout):
+        raise LLMResponseError("400 Bad Request", transient=False)
+
+    with pytest.raises(LLMResponseError):
+        call_with_resilience(bad_request, deadline=5, circuit=circuit)
+    # The trial ended without counting against the server; another one may run
+    assert call_with_resilience(lambda timeout: "ok", deadline=5, circuit=circuit) == "ok"
+    assert circuit.state == "closed"
+
+
+def test_unexpected_error_in_half_open_trial_reopens_circuit():
+    circuit = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+    circuit.record_failure()
+    time.sleep(0.15)
+
+    def broken(timeout):
+        raise ValueError("not JSON")
+
+    with pytest.raises(ValueError):
+        call_with_resilience(broken, deadline=5, circuit=circuit)
+    # The trial was recorded as a failure rather than left in flight
+    assert circuit.state == "open"
+    time.sleep(0.15)
+    assert call_with_resilience(lambda timeout: "ok", deadline=5, circuit=circuit) == "ok"
+
+
+def test_cli_stub_answers(stub_cli):
+    assert "Stub summary" in generate_embeddings.run_ollama_model("Summarize this document.", task="summary")
+    assert breaker.state == "closed"
+
+
+def test_cli_stub_failures_are_retried_then_raised(stub_cli):
+    stub_cli.setenv("STUB_LLM_FAILURE_RATE", "1")
+    with pytest.raises(LLMResponseError, match="injected failure"):
+        generate_embeddings.run_ollama_model("Summarize this document.", task="summary")
+    assert breaker.failures == LLM_MAX_ATTEMPTS
+
+
+def test_cli_stub_timeout_respects_task_deadline(stub_cli):
+    stub_cli.setenv("STUB_LLM_LATENCY", "5")
+    stub_cli.setitem(LLM_DEADLINES, "summary", 1.0)
+    start = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        generate_embeddings.run_ollama_model("Summarize this document.", task="summary")
+    assert time.monotonic() - start < 3
+
+
+def test_open_breaker_fails_fast_without_calling_the_cli(stub_cli):
+    stub_cli.setattr(generate_embeddings, "OLLAMA_COMMAND", ["/nonexistent/ollama"])
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    with pytest.raises(LLMUnavailableError, match="circuit open"):
+        generate_embeddings.run_ollama_model("Summarize this document.")
+
+
+def test_llm_warmup_failures_do_not_count_against_the_shared_breaker(stub_cli):
+    import warmup
+
+    stub_cli.setattr(warmup, "OLLAMA_HOST", "http://127.0.0.1:9")  # nothing listens; preload fails fast
+    stub_cli.setenv("STUB_LLM_FAILURE_RATE", "1")
+    with pytest.raises(LLMResponseError):
+        warmup.warm_up_llm()
+    assert breaker.failures == 0
+    assert breaker.state == "closed"
+
+
+def test_chat_stub_answers_and_keeps_history(stub_server):
+    chat = profile_chat.ProfileChatSession({"Credit Score Report": "Risk Level: Low"})
+    assert chat.ask("What is their loan eligibility?")
+    assert chat.ask("Summarize the main risks.")
+    assert len(chat.history) == 2
+
+
+def test_chat_history_is_trimmed_in_blocks(stub_server):
+    chat = profile_chat.ProfileChatSession({}, max_turns=4, trim_turns=2)
+    sizes = []
+    for i in range(7):
+        chat.ask(f"Question {i}?")
+        sizes.append(len(chat.history))
+    assert sizes == [1, 2, 3, 4, 3, 4, 3]
+    assert [question for question, _ in chat.history] == ["Question 4?", "Question 5?", "Question 6?"]
+
+
+def test_chat_replays_an_unchanged_prefix_between_trims(stub_server):
+    chat = profile_chat.ProfileChatSession({}, max_turns=4, trim_turns=2)
+    for i in range(4):
+        chat.ask(f"Question {i}?")
+    chat.ask("Question 4?")  # trims the two oldest turns
+    after = chat._messages("Next?")[:-1]
+    assert after[1]["content"] == "Question 2?"
+    chat.ask("Question 5?")
+    # No trim this time: the previous request is a prefix of the next one
+    assert chat._messages("Next?")[:len(after)] == after
+
+
+def test_chat_stub_failures_are_not_added_to_history(stub_server):
+    stub_server.setattr(stub_llm, "STUB_FAILURE_RATE", 1.0)
+    chat = profile_chat.ProfileChatSession({})
+    with pytest.raises(LLMResponseError, match="503"):
+        chat.ask("What is their loan eligibility?")
+    assert chat.history == []
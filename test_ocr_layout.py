@@ -0,0 +1,111 @@
+"""Layout reconstruction and numbers read from OCR lines (ocr_layout.py, extract_numeric_fields).
+
+Run with `python -m pytest -q test_ocr_layout.py`.
+"""
+import pandas as pd
+import generate_embeddings
+from documents import InMemoryDocument
+from generate_embeddings import extract_numeric_fields
+from ocr_layout import OCRLine, OCRPage, numeric_table, parse_number
+
+
+def line(text, x0, y0, width=120, confidence=0.95):
+    return OCRLine(text, confidence, (x0, y0, x0 + width, y0 + 20))
+
+
+def credit_report_page():
+    """A credit report as PaddleOCR reads it: labelled values, then an accounts table."""
+    return OCRPage([
+        line("CREDIT REPORT", 200, 10, width=200),
+        line("Credit Score: 750 (Good)", 20, 50, width=260),
+        line("Total Debt", 20, 80),
+        line("Rs 1,20,000", 300, 82),
+        line("Credit Utilization:", 20, 110),
+        line("35%", 300, 111, width=50),
+        line("Account", 20, 160),
+        line("Type", 200, 160),
+        line("Balance", 380, 160),
+        line("HDFC-001", 20, 190),
+        line("Home Loan", 200, 191),
+        line("Rs 9,50,000", 380, 189),
+        line("SBI-442", 20, 220),
+        line("Credit Card", 200, 220),
+        line("12,500", 385, 221, width=100),
+        line("Note: 99", 20, 300, confidence=0.2),  # Too faint to trust
+    ])
+
+
+def test_parse_number_accepts_amounts_scores_and_percentages():
+    assert parse_number("Rs 1,20,000") == 120000.0
+    assert parse_number("750 (Good)") == 750.0
+    assert parse_number("35%") == 35.0
+    assert parse_number("OMR -12.5") == -12.5
+    assert parse_number("Home Loan") is None
+    assert parse_number("12 of 15") is None
+    assert parse_number(None) is None
+
+
+def test_numeric_fields_read_labelled_values_outside_tables():
+    fields = credit_report_page().numeric_fields()
+
+    assert fields == {"Credit Score": 750.0, "Total Debt": 120000.0, "Credit Utilization": 35.0}
+
+
+def test_tables_keep_cells_as_text_aligned_to_their_columns():
+    tables = credit_report_page().tables()
+
+    assert len(tables) == 1
+    assert tables[0].columns.tolist() == ["Account", "Type", "Balance"]
+    assert tables[0].values.tolist() == [
+        ["HDFC-001", "Home Loan", "Rs 9,50,000"],
+        ["SBI-442", "Credit Card", "12,500"],
+    ]
+
+
+def test_numeric_table_converts_only_numeric_columns():
+    table = numeric_table(credit_report_page().tables()[0])
+
+    assert table["Balance"].tolist() == [950000.0, 12500.0]
+    assert table["Account"].tolist() == ["HDFC-001", "SBI-442"]
+    assert table["Type"].tolist() == ["Home Loan", "Credit Card"]
+
+
+def test_numeric_table_keeps_mostly_text_columns_and_ignores_blank_cells():
+    table = pd.DataFrame({
+        "Remarks": ["Closed", "12", "Overdue"],
+        "Limit": ["50,000", "", "75,000"],
+    })
+    converted = numeric_table(table)
+
+    assert converted["Remarks"].tolist() == ["Closed", "12", "Overdue"]
+    assert converted["Limit"].iloc[0] == 50000.0 and pd.isna(converted["Limit"].iloc[1])
+    assert table["Limit"].tolist() == ["50,000", "", "75,000"]  # The input is not modified
+
+
+def test_extract_numeric_fields_merges_pages_and_converts_tables(monkeypatch):
+    second_page = OCRPage([line("Credit Score: 610", 20, 50, width=200), line("Open Accounts", 20, 80), line("4", 300, 80, width=20)])
+    monkeypatch.setattr(generate_embeddings, "extract_layout", lambda document: [credit_report_page(), second_page])
+
+    fields, tables = extract_numeric_fields(InMemoryDocument("report.png", b"not decoded"))
+
+    # The first page's value wins when a label repeats
+    assert fields == {"Credit Score": 750.0, "Total Debt": 120000.0, "Credit Utilization": 35.0, "Open Accounts": 4.0}
+    assert len(tables) == 1 and tables[0]["Balance"].tolist() == [950000.0, 12500.0]
+
+
+def test_extract_numeric_fields_skips_documents_without_an_ocr_layout(monkeypatch):
+    def fail(document):
+        raise AssertionError("PDFs are not OCR'd")
+
+    monkeypatch.setattr(generate_embeddings, "extract_layout", fail)
+
+    assert extract_numeric_fields(InMemoryDocument("report.pdf", b"%PDF-1.4")) == ({}, [])
+
+
+def test_extract_numeric_fields_returns_nothing_when_ocr_fails(monkeypatch):
+    def fail(document):
+        raise RuntimeError("OCR models unavailable")
+
+    monkeypatch.setattr(generate_embeddings, "extract_layout", fail)
+
+    assert extract_numeric_fields(InMemoryDocument("report.jpg", b"not decoded")) == ({}, [])
@@ -0,0 +1,139 @@
+"""Compaction and queries of the partitioned portfolio store (portfolio_store.py).
+
+Run with `python -m pytest -q test_portfolio_store.py`.
+"""
+import os
+import pandas as pd
+import pytest
+import portfolio_store
+from portfolio_store import COMPACT_LOCK_NAME, PortfolioStore, customer_key
+
+
+def record(customer_id, profiled_at, risk, savings, name="Jane Doe"):
+    return {
+        "customer_id": customer_id,
+        "profiled_at": pd.Timestamp(profiled_at),
+        "customer_name": name,
+        "date_of_birth": None,
+        "id_number": None,
+        "total_salary": None,
+        "total_expenditure": None,
+        "estimated_savings": savings,
+        "total_investments": None,
+        "flagged_transactions": None,
+        "sale_amount": None,
+        "credit_risk_level": risk,
+    }
+
+
+def parquet_files(store, risk):
+    partition_dir = store._partition_dir(risk)
+    return sorted(name for name in os.listdir(partition_dir) if name.endswith(".parquet"))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PortfolioStore(str(tmp_path))
+
+
+def test_compaction_keeps_only_each_customers_latest_profile(store):
+    store.append(record("ID-1", "2026-01-01", "Low", 100.0))
+    store.append(record("ID-1", "2026-02-01", "Low", 300.0))
+    store.append(record("ID-2", "2026-01-15", "Low", 200.0))
+
+    store.compact("Low")
+
+    files = parquet_files(store, "Low")
+    assert len(files) == 1 and files[0].startswith("compacted-")
+    rows = store.query(latest_only=False)
+    assert sorted(rows["customer_id"]) == ["ID-1", "ID-2"]
+    assert rows.set_index("customer_id").loc["ID-1", "estimated_savings"] == 300.0
+
+
+def test_compaction_drops_profiles_superseded_in_another_partition(store):
+    store.append(record("ID-1", "2026-01-01", "Low", 100.0))
+    store.append(record("ID-2", "2026-01-01", "Low", 200.0))
+    store.append(record("ID-1", "2026-03-01", "High", 50.0))
+
+    store.compact()
+
+    rows = store.query(latest_only=False)
+    assert sorted(zip(rows["customer_id"], rows["credit_risk_level"])) == [("ID-1", "High"), ("ID-2", "Low")]
+
+
+def test_compacted_partition_is_sorted_for_range_pruning(store):
+    for i, savings in enumerate([500.0, None, 100.0, 300.0]):
+        store.append(record(f"ID-{i}", "2026-01-01", "Medium", savings))
+
+    store.compact("Medium")
+
+    savings = store.query(risk_levels=["Medium"])["estimated_savings"].tolist()
+    assert pd.isna(savings[0]) and savings[1:] == [100.0, 300.0, 500.0]
+    assert store.query(min_savings=200, max_savings=400)["customer_id"].tolist() == ["ID-3"]
+
+
+def test_query_filters_each_customers_latest_profile(store):
+    store.append(record("ID-1", "2026-01-01", "Low", 10_000.0))
+    store.append(record("ID-1", "2026-02-01", "High", 10.0))
+
+    assert store.query(risk_levels=["Low"]).empty
+    assert store.query(risk_levels=["Low"], latest_only=False)["customer_id"].tolist() == ["ID-1"]
+
+
+def test_name_search_is_case_insensitive(store):
+    store.append(record("ID-1", "2026-01-01", "Low", 1.0, name="John Smith"))
+    store.append(record("ID-2", "2026-01-01", "Low", 1.0, name="Jane Doe"))
+
+    assert store.query(name="JOHN", columns=["customer_id"])["customer_id"].tolist() == ["ID-1"]
+
+
+def test_locked_partition_is_skipped(store):
+    store.append(record("ID-1", "2026-01-01", "Low", 1.0))
+    store.append(record("ID-2", "2026-01-01", "Low", 2.0))
+    lock_path = os.path.join(store._partition_dir("Low"), COMPACT_LOCK_NAME)
+    open(lock_path, "w").close()
+
+    store.compact("Low")
+    assert len(parquet_files(store, "Low")) == 2
+
+    os.remove(lock_path)
+    store.compact("Low")
+    assert len(parquet_files(store, "Low")) == 1
+    assert not os.path.exists(lock_path)
+
+
+def test_stale_lock_is_taken_over(store, monkeypatch):
+    store.append(record("ID-1", "2026-01-01", "Low", 1.0))
+    store.append(record("ID-2", "2026-01-01", "Low", 2.0))
+    open(os.path.join(store._partition_dir("Low"), COMPACT_LOCK_NAME), "w").close()
+    monkeypatch.setattr(portfolio_store, "COMPACT_LOCK_STALE_SECONDS", -1)
+
+    store.compact("Low")
+    assert len(parquet_files(store, "Low")) == 1
+
+
+def test_compaction_tolerates_files_removed_meanwhile(store, monkeypatch):
+    store.append(record("ID-1", "2026-01-01", "Low", 1.0))
+    store.append(record("ID-2", "2026-01-01", "Low", 2.0))
+    partition_dir = store._partition_dir("Low")
+    vanished = os.path.join(partition_dir, parquet_files(store, "Low")[0])
+
+    # Another process removes a file between listing and reading the partition
+    listdir = os.listdir
+
+    def listdir_then_remove(path):
+        names = listdir(path)
+        if path == partition_dir and os.path.exists(vanished):
+            os.remove(vanished)
+        return names
+
+    monkeypatch.setattr(os, "listdir", listdir_then_remove)
+    store._compact_partition(partition_dir, store._latest_keys())
+    monkeypatch.undo()
+
+    assert store.query(latest_only=False)["customer_id"].tolist() == ["ID-2"]
+
+
+def test_customer_key_normalizes_id_numbers():
+    assert customer_key(" p-1234 567 ", "session") == "ID-P1234567"
+    assert customer_key(None, "session") == "session"
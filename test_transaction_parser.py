@@ -0,0 +1,178 @@
+"""TXN_DESC parsing and spend summaries (transaction_parser.py), on descriptions from the sample statement.
+
+Run with `python -m pytest -q test_transaction_parser.py`.
+"""
+import pandas as pd
+import pytest
+from transaction_parser import (
+    parse_transactions,
+    recurring_partials,
+    recurring_payments,
+    recurring_payments_from_partials,
+    top_merchants
+)
+
+# Descriptions as they appear in backend_documents/Bank_Statement.csv
+ONS_POS = "ONS POS,0712202304558,334112914816,5491310000351500,SHELL OMAN - SAROOJ SS\\\\AL SAROOJ\\  "
+ONS_POS_WITH_TERMINAL = (
+    "ONS POS,02062023215620,315350059744,5491310000351500,TALABAT\\\\\\       111   OMN "
+    "Ref.315350059744-0602215620-OMPG0040@TALABAT\\\\\\       111 OMPG0040"
+)
+MC_POS = "MC POS 002788-0801190729-81730155@MAENAM PHARMACY  MC POS 002788-0801190729-81730155@MAENAM"
+STANDING_ORDER = "Stndg Order - Local # {reference},  {amount} OMR   {amount} OMR "
+CARD_PURCHASE = "ONS POS,{day}{month:02d}2024101500,33411291{month:04d},5491310000351500,SHELL OMAN - SAROOJ SS\\\\AL SAROOJ\\  "
+TRANSFER = "Mobile-App Transfer To 00110011512003 # 6203342,Transfer ref.IB1687192161852  Ref. IB1687192161852 "
+
+
+def statement(rows):
+    """(posting time, description, amount[, indicator]) tuples as a statement frame."""
+    df = pd.DataFrame(
+        [row if len(row) == 4 else (*row, "D") for row in rows],
+        columns=["TXN_DATE_TIME", "TXN_DESC", "TXN_AMOUNT_LCY", "CR_DR_INDICATOR"]
+    )
+    df["TXN_DATE_TIME"] = pd.to_datetime(df["TXN_DATE_TIME"])
+    return df
+
+
+def parsed_row(description):
+    return parse_transactions(statement([("2024-06-01", description, 1.0)])).iloc[0]
+
+
+def test_ons_pos_record_is_split_into_its_fields():
+    row = parsed_row(ONS_POS)
+
+    assert row["TXN_CHANNEL"] == "ONS POS"
+    # 13-digit timestamps have an unpadded minute: 07-12-2023 04:05:58
+    assert row["TXN_LOCAL_TIME"] == pd.Timestamp("2023-12-07 04:05:58")
+    assert row["TXN_REFERENCE"] == "334112914816"
+    assert row["TXN_CARD"] == "549131******1500"
+    assert row["MERCHANT"] == "SHELL OMAN - SAROOJ SS"
+    assert row["MERCHANT_LOCATION"] == "AL SAROOJ"
+    assert row["COUNTERPARTY"] == "SHELL OMAN - SAROOJ SS"
+
+
+def test_ons_pos_terminal_suffix_is_split_off_the_merchant():
+    row = parsed_row(ONS_POS_WITH_TERMINAL)
+
+    assert row["MERCHANT"] == "TALABAT"
+    assert row["TXN_TERMINAL"] == "OMPG0040"
+    assert row["TXN_LOCAL_TIME"] == pd.Timestamp("2023-06-02 21:56:20")
+
+
+def test_mc_pos_record_is_split_into_its_fields():
+    row = parsed_row(MC_POS)
+
+    assert row["TXN_CHANNEL"] == "MC POS"
+    assert row["TXN_REFERENCE"] == "002788"
+    assert row["TXN_TERMINAL"] == "81730155"
+    assert row["MERCHANT"] == "MAENAM PHARMACY"
+    assert (row["TXN_LOCAL_TIME"].month, row["TXN_LOCAL_TIME"].day, row["TXN_LOCAL_TIME"].hour) == (8, 1, 19)
+    assert pd.isna(row["TXN_CARD"])
+
+
+@pytest.mark.parametrize("description, channel, reference, counterparty", [
+    (STANDING_ORDER.format(reference=6685644, amount=500), "Stndg Order - Local", "6685644", "STNDG ORDER - LOCAL"),
+    ("Intrabank SO # 6340739  ", "Intrabank SO", "6340739", "INTRABANK SO"),
+    (TRANSFER, "Mobile-App Transfer To", "6203342", "MOBILE-APP TRANSFER TO"),
+    ("MONTHLY SALARY", "MONTHLY SALARY", None, "MONTHLY SALARY"),
+])
+def test_transfers_and_orders_are_keyed_by_their_description(description, channel, reference, counterparty):
+    row = parsed_row(description)
+
+    assert row["TXN_CHANNEL"] == channel
+    assert (pd.isna(row["TXN_REFERENCE"]) if reference is None else row["TXN_REFERENCE"] == reference)
+    assert row["COUNTERPARTY"] == counterparty
+    assert pd.isna(row["MERCHANT"])
+
+
+def test_missing_description_parses_to_missing_fields():
+    row = parsed_row(None)
+
+    assert pd.isna(row["TXN_CHANNEL"]) and pd.isna(row["COUNTERPARTY"])
+
+
+def test_repeated_descriptions_parse_identically():
+    parsed = parse_transactions(statement([("2024-06-01", ONS_POS, 1.0), ("2024-06-02", ONS_POS, 2.0)]))
+
+    assert parsed["MERCHANT"].tolist() == ["SHELL OMAN - SAROOJ SS"] * 2
+
+
+def monthly(description, amount, months=4, day=25):
+    return [(f"2024-{month:02d}-{day}", description.format(reference=6328590 + month, amount=amount), amount)
+            for month in range(1, months + 1)]
+
+
+def test_standing_orders_sharing_a_description_are_split_by_amount():
+    rows = monthly(STANDING_ORDER, 1500) + monthly(STANDING_ORDER, 100, day=26)
+    recurring = recurring_payments(parse_transactions(statement(rows)))
+
+    assert sorted(recurring.index) == ["STNDG ORDER - LOCAL (1,500)", "STNDG ORDER - LOCAL (100)"]
+    assert recurring.loc["STNDG ORDER - LOCAL (1,500)", "Typical Amount"] == 1500
+    assert recurring.loc["STNDG ORDER - LOCAL (100)", "Months"] == 4
+
+
+def test_nearby_amounts_share_a_bucket():
+    # Two significant digits: 1,480 and 1,520 both round to 1,500
+    rows = [
+        ("2024-01-25", STANDING_ORDER.format(reference=1, amount=1480), 1480.0),
+        ("2024-02-25", STANDING_ORDER.format(reference=2, amount=1520), 1520.0),
+        ("2024-03-25", STANDING_ORDER.format(reference=3, amount=1500), 1500.0),
+    ]
+    recurring = recurring_payments(parse_transactions(statement(rows)))
+
+    assert recurring.index.tolist() == ["STNDG ORDER - LOCAL"]
+
+
+def test_months_follow_the_card_local_time_not_the_posting_date():
+    # Posted in four months, but all bought on 07-12-2023
+    rows = [(f"2024-{month:02d}-05", ONS_POS, 18.0) for month in range(1, 5)]
+
+    assert recurring_payments(parse_transactions(statement(rows))).empty
+
+
+def test_stable_card_spend_recurs_as_a_whole_and_is_not_split():
+    rows = [(f"2024-{month:02d}-06", CARD_PURCHASE.format(day="05", month=month), amount)
+            for month, amount in [(1, 18.0), (2, 19.5), (3, 17.2), (4, 18.4)]]
+    recurring = recurring_payments(parse_transactions(statement(rows)))
+
+    assert recurring.index.tolist() == ["SHELL OMAN - SAROOJ SS"]
+    assert recurring.loc["SHELL OMAN - SAROOJ SS", "Typical Amount"] == pytest.approx(18.275)
+
+
+def test_irregular_card_spend_is_not_split_into_instalments():
+    # Varies too much to recur as a whole; card purchases are never split by amount
+    amounts = [5.0, 80.0, 5.1, 81.0, 5.2, 79.0, 4.9, 80.5]
+    rows = [(f"2024-{month:02d}-{day:02d}", CARD_PURCHASE.format(day=f"{day:02d}", month=month), amount)
+            for (month, day), amount in zip([(m, d) for m in range(1, 5) for d in (3, 17)], amounts)]
+
+    assert recurring_payments(parse_transactions(statement(rows))).empty
+
+
+def test_payments_in_too_few_months_do_not_recur():
+    rows = monthly(STANDING_ORDER, 500, months=2)
+
+    assert recurring_payments(parse_transactions(statement(rows))).empty
+
+
+def test_partials_merged_across_batches_match_the_whole_statement():
+    rows = monthly(STANDING_ORDER, 1500) + monthly(STANDING_ORDER, 100, day=26)
+    parsed = parse_transactions(statement(rows))
+    halves = [recurring_partials(parsed.iloc[::2]), recurring_partials(parsed.iloc[1::2])]
+    merged = pd.concat(halves).groupby(level=list(range(halves[0].index.nlevels)), observed=True).agg(
+        {"Payments": "sum", "Amount_Sum": "sum", "Amount_Sumsq": "sum", "Last_Payment": "max"}
+    )
+
+    pd.testing.assert_frame_equal(recurring_payments_from_partials(merged), recurring_payments(parsed))
+
+
+def test_top_merchants_ranks_debit_spend():
+    rows = [
+        ("2024-06-01", ONS_POS, 20.0),
+        ("2024-06-02", ONS_POS, 25.0),
+        ("2024-06-03", MC_POS, 30.0),
+        ("2024-06-04", MC_POS, 500.0, "C"),  # a refund is not spend
+    ]
+    merchants = top_merchants(parse_transactions(statement(rows)))
+
+    assert merchants.index.tolist() == ["SHELL OMAN - SAROOJ SS", "MAENAM PHARMACY"]
+    assert merchants["Transactions"].tolist() == [2, 1]
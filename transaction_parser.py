@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+
+# Columns added by `parse_transactions`
+PARSED_COLUMNS = [
+    "TXN_CHANNEL", "TXN_LOCAL_TIME", "TXN_REFERENCE", "TXN_CARD", "TXN_TERMINAL",
+    "MERCHANT", "MERCHANT_LOCATION", "COUNTERPARTY",
+]
+
+# Interned as categoricals: few distinct values repeated across many rows
+PARSED_CATEGORICAL_COLUMNS = ["TXN_CHANNEL", "TXN_CARD", "TXN_TERMINAL", "MERCHANT", "MERCHANT_LOCATION", "COUNTERPARTY"]
+
+# "MC POS 332916238532-1125163046-03803620@AutogrillMiddleEastLLC  MC POS 332916238532-..."
+# (the reference, MMDDhhmmss local time and terminal are repeated after the merchant)
+MC_PATTERN = (
+    r"^(?P<channel>MC [A-Z]+) (?P<reference>\d+)-(?P<time>\d{10})-(?P<terminal>[^@\s]*)@"
+    r"(?P<merchant>.*?)(?:\s{2,}MC [A-Z]+ \d+-.*)?$"
+)
+
+# Merchant field of "ONS POS" records: "NAME\LOCATION\..." optionally followed by " Ref.<ref>-<time>-<terminal>@..."
+MERCHANT_FIELD_PATTERN = r"^(?P<merchant>[^\\]*?)\s*(?:\\+\s*(?P<location>[^\\]*?)\s*(?:\\.*)?)?$"
+TERMINAL_SUFFIX_PATTERN = r"\s+Ref\.\d+-\d+-(?P<terminal>[^@\s]+)@.*$"
+
+# Recurring payments: paid in at least this many distinct months, with amounts this stable
+RECURRING_MIN_MONTHS = 3
+RECURRING_MAX_AMOUNT_VARIATION = 0.25
+
+
+def _collapse(text):
+    """Strips and collapses runs of whitespace; empty strings become missing values."""
+    text = text.str.replace(r"\s+", " ", regex=True).str.strip()
+    return text.mask(text == "")
+
+
+def _mask_card(card):
+    return card.str[:6] + "******" + card.str[-4:]
+
+
+def _local_timestamps(text):
+    """Parses ddmmyyyyHHMMSS timestamps; 13-digit values have an unpadded minute (HHMSS)."""
+    text = text.where(text.str.len() != 13, text.str[:10] + "0" + text.str[10:])
+    return pd.to_datetime(text, format="%d%m%Y%H%M%S", errors="coerce")
+
+
+def _parse_unique(uniques):
+    """Parses distinct descriptions into the structured fields (one row per description).
+
+    Returns the fields plus the raw MMDDhhmmss time of "MC" records, which carry no year.
+    """
+    parsed = pd.DataFrame(index=uniques.index, columns=PARSED_COLUMNS, dtype="object")
+    parsed["TXN_LOCAL_TIME"] = pd.NaT
+    mc_time = pd.Series(np.nan, index=uniques.index, dtype="object")
+
+    # Batches without any 5-field record get all-missing (float) padding columns
+    parts = uniques.str.split(",", n=4, expand=True).reindex(columns=range(5)).astype("object")
+    parts = parts.apply(lambda column: column.str.strip())
+    digits = parts.apply(lambda column: column.str.fullmatch(r"\d+").fillna(False).astype(bool))
+    lengths = parts.apply(lambda column: column.str.len())
+
+    # "ONS POS,<ddmmyyyyHHMMSS>,<reference>,<card>,<merchant>\<location>\..."
+    card_record = ~digits[0] & digits[1] & lengths[1].between(13, 14) & digits[2] & digits[3] & (lengths[3] == 16)
+    if card_record.any():
+        rows = parts[card_record]
+        field = rows[4].fillna("")
+        merchant_field = field.str.replace(TERMINAL_SUFFIX_PATTERN, "", regex=True).str.extract(MERCHANT_FIELD_PATTERN)
+        parsed.loc[card_record, "TXN_CHANNEL"] = rows[0]
+        parsed.loc[card_record, "TXN_LOCAL_TIME"] = _local_timestamps(rows[1])
+        parsed.loc[card_record, "TXN_REFERENCE"] = rows[2]
+        parsed.loc[card_record, "TXN_CARD"] = _mask_card(rows[3])
+        parsed.loc[card_record, "TXN_TERMINAL"] = field.str.extract(TERMINAL_SUFFIX_PATTERN)["terminal"]
+        parsed.loc[card_record, "MERCHANT"] = _collapse(merchant_field["merchant"])
+        parsed.loc[card_record, "MERCHANT_LOCATION"] = _collapse(merchant_field["location"].fillna(""))
+
+    # "<card>,<MMDDYYYY>,<MMDD>,W/D ref <n>,<reference>" (cash withdrawals)
+    withdrawal = digits[0] & (lengths[0] == 16) & digits[1] & (lengths[1] == 8)
+    if withdrawal.any():
+        rows = parts[withdrawal]
+        parsed.loc[withdrawal, "TXN_CHANNEL"] = rows[3].str.extract(r"^(\D+?)\s*ref", expand=False).fillna("W/D")
+        parsed.loc[withdrawal, "TXN_LOCAL_TIME"] = pd.to_datetime(rows[1], format="%m%d%Y", errors="coerce")
+        parsed.loc[withdrawal, "TXN_REFERENCE"] = rows[4]
+        parsed.loc[withdrawal, "TXN_CARD"] = _mask_card(rows[0])
+
+    # "ONS AC TO AC FT,<account>,<reference>,<ddmmyyyyHHMMSS>" (account-to-account transfers)
+    transfer = ~digits[0] & digits[1] & digits[2] & digits[3] & lengths[3].between(13, 14) & parts[4].isna()
+    if transfer.any():
+        rows = parts[transfer]
+        parsed.loc[transfer, "TXN_CHANNEL"] = rows[0]
+        parsed.loc[transfer, "TXN_LOCAL_TIME"] = _local_timestamps(rows[3])
+        parsed.loc[transfer, "TXN_REFERENCE"] = rows[2]
+
+    # "MC POS|MC ATM <reference>-<MMDDhhmmss>-<terminal>@<merchant>  MC POS ..."
+    mc = uniques.str.extract(MC_PATTERN)
+    mc_record = mc["channel"].notna() & ~(card_record | withdrawal | transfer)
+    if mc_record.any():
+        rows = mc[mc_record]
+        parsed.loc[mc_record, "TXN_CHANNEL"] = rows["channel"]
+        parsed.loc[mc_record, "TXN_REFERENCE"] = rows["reference"]
+        parsed.loc[mc_record, "TXN_TERMINAL"] = rows["terminal"].mask(rows["terminal"] == "")
+        parsed.loc[mc_record, "MERCHANT"] = _collapse(rows["merchant"])
+        mc_time[mc_record] = rows["time"]
+
+    # Free-text descriptions ("Local Transfer To 9006... # 8840018  Rental"): leading words and "# <reference>"
+    free_text = ~(card_record | withdrawal | transfer | mc_record)
+    if free_text.any():
+        rows = uniques[free_text]
+        parsed.loc[free_text, "TXN_CHANNEL"] = rows.str.extract(r"^([A-Za-z][A-Za-z&\- ]*[A-Za-z])", expand=False)
+        parsed.loc[free_text, "TXN_REFERENCE"] = rows.str.extract(r"#\s*(\d+)", expand=False)
+
+    # Who the money went to or came from: the merchant if known, else the description's text up
+    # to its first comma, without account numbers and references
+    normalized = uniques.str.upper().str.split(",", n=1).str[0].str.replace(r"[\d#]+", " ", regex=True)
+    parsed["COUNTERPARTY"] = parsed["MERCHANT"].str.upper().fillna(_collapse(normalized))
+    parsed["TXN_CHANNEL"] = _collapse(parsed["TXN_CHANNEL"].fillna(""))
+
+    parsed["TXN_LOCAL_TIME"] = pd.to_datetime(parsed["TXN_LOCAL_TIME"])
+    return parsed, mc_time
+
+
+def parse_transactions(df):
+    """Splits packed `TXN_DESC` records into structured columns (see PARSED_COLUMNS).
+
+    Parsing runs once per distinct description and is broadcast back through the
+    factorized codes, so repeated descriptions cost nothing; the text columns are
+    interned as categoricals. Records without a year in their local time (MC POS/ATM)
+    take it from the posting date.
+    """
+    codes, uniques = pd.factorize(df["TXN_DESC"].fillna("").astype(str))
+    parsed_unique, mc_time = _parse_unique(pd.Series(uniques, dtype="object"))
+
+    for column in PARSED_CATEGORICAL_COLUMNS:
+        parsed_unique[column] = parsed_unique[column].astype("category")
+    parsed = parsed_unique.take(codes)
+    parsed.index = df.index
+
+    mc_time = mc_time.take(codes)
+    mc_time.index = df.index
+    has_mc_time = mc_time.notna() & df["TXN_DATE_TIME"].notna()
+    if has_mc_time.any():
+        posted = pd.to_datetime(df.loc[has_mc_time, "TXN_DATE_TIME"])
+        text = mc_time[has_mc_time]
+        local = pd.to_datetime(posted.dt.year.astype(str) + text, format="%Y%m%d%H%M%S", errors="coerce")
+        # A December purchase posted in January belongs to the previous year
+        previous_year = pd.to_datetime((posted.dt.year - 1).astype(str) + text, format="%Y%m%d%H%M%S", errors="coerce")
+        local = local.where(local <= posted + pd.Timedelta(days=1), previous_year)
+        parsed.loc[has_mc_time, "TXN_LOCAL_TIME"] = local
+
+    result = df.copy()
+    for column in PARSED_COLUMNS:
+        result[column] = parsed[column]
+    return result
+
+
+def _debits(df):
+    """Debits of a statement with their posting DAY, the key of every partial aggregate."""
+    debits = df[df["CR_DR_INDICATOR"] == "D"]
+    return debits.assign(DAY=debits["TXN_DATE_TIME"].dt.normalize())
+
+
+# **Partial aggregates**
+# Each `*_partials(batch)` reduces a batch to small additive aggregates indexed by DAY; partials
+# of several batches are merged by concatenating and re-aggregating with the matching
+# `*_PARTIAL_AGGREGATES`, and a time range is a filter on DAY (see statement_aggregates.py).
+SPEND_PARTIAL_AGGREGATES = {"Total Spend": "sum", "Transactions": "sum"}
+RECURRING_PARTIAL_AGGREGATES = {"Payments": "sum", "Amount_Sum": "sum", "Amount_Sumsq": "sum", "Last_Payment": "max"}
+CARD_PARTIAL_AGGREGATES = {"Transactions": "sum", "Total Spend": "sum"}
+
+
+def spend_partials(df):
+    """Debit spend and count per (DAY, MERCHANT)."""
+    debits = _debits(df)
+    debits = debits[debits["MERCHANT"].notna()]
+    return debits.groupby(["DAY", "MERCHANT"], observed=True)["TXN_AMOUNT_LCY"].agg(**{
+        "Total Spend": "sum", "Transactions": "size"
+    })
+
+
+def _round_amount(amount):
+    """Amounts rounded to two significant digits, so a fixed payment lands in one bucket."""
+    magnitude = 10.0 ** (np.floor(np.log10(amount.abs().clip(lower=1))) - 1)
+    return (amount / magnitude).round() * magnitude
+
+
+def recurring_partials(df):
+    """Debit count, sum, sum of squares and latest time per (DAY, MONTH, COUNTERPARTY, AMOUNT_BUCKET, IS_CARD).
+
+    MONTH and the payment time use the local time where known, DAY the posting date.
+    """
+    debits = _debits(df)
+    time = debits["TXN_LOCAL_TIME"].fillna(debits["TXN_DATE_TIME"])
+    amount = debits["TXN_AMOUNT_LCY"]
+    debits = debits.assign(
+        MONTH=time.dt.to_period("M"),
+        AMOUNT_BUCKET=_round_amount(amount),
+        IS_CARD=debits["TXN_CARD"].notna(),
+        TIME=time,
+        AMOUNT_SQUARED=amount ** 2,
+    )
+    return debits.groupby(["DAY", "MONTH", "COUNTERPARTY", "AMOUNT_BUCKET", "IS_CARD"], observed=True).agg(
+        Payments=("TXN_AMOUNT_LCY", "size"),
+        Amount_Sum=("TXN_AMOUNT_LCY", "sum"),
+        Amount_Sumsq=("AMOUNT_SQUARED", "sum"),
+        Last_Payment=("TIME", "max"),
+    )
+
+
+def card_partials(df):
+    """Card debit count and spend per (DAY, TXN_CARD, TXN_CHANNEL, MERCHANT)."""
+    debits = _debits(df)
+    debits = debits[debits["TXN_CARD"].notna()]
+    return debits.groupby(["DAY", "TXN_CARD", "TXN_CHANNEL", "MERCHANT"], observed=True, dropna=False)["TXN_AMOUNT_LCY"].agg(**{
+        "Transactions": "size", "Total Spend": "sum"
+    })
+
+
+# **Summaries from partial aggregates**
+def top_merchants_from_partials(partials, n=10):
+    """Debit spend per merchant, largest first."""
+    spend = partials.groupby(level="MERCHANT", observed=True).sum()
+    return spend.sort_values("Total Spend", ascending=False).head(n)
+
+
+def _stable_recurring(partials, keys, min_months, max_variation):
+    """Groups of recurring partials by `keys` paid in enough distinct months with a stable amount."""
+    flat = partials.reset_index()
+    grouped = flat.groupby(keys, observed=True)
+    payments = grouped.agg(
+        Payments=("Payments", "sum"),
+        Months=("MONTH", "nunique"),
+        Amount_Sum=("Amount_Sum", "sum"),
+        Amount_Sumsq=("Amount_Sumsq", "sum"),
+        Last_Payment=("Last_Payment", "max"),
+    )
+    count = payments["Payments"]
+    typical = payments["Amount_Sum"] / count
+    variance = (payments["Amount_Sumsq"] - payments["Amount_Sum"] * typical) / (count - 1).where(count > 1)
+    std = np.sqrt(variance.clip(lower=0)).fillna(0)
+    variation = std / typical.where(typical > 0)
+
+    payments = payments.assign(Typical_Amount=typical)[["Payments", "Months", "Typical_Amount", "Last_Payment"]]
+    return payments[(payments["Months"] >= min_months) & (variation <= max_variation)]
+
+
+def recurring_payments_from_partials(partials, min_months=RECURRING_MIN_MONTHS, max_variation=RECURRING_MAX_AMOUNT_VARIATION):
+    """Debits to the same counterparty paid in several distinct months with a stable (average) amount.
+
+    A counterparty with several fixed payments of different amounts (e.g. standing orders,
+    which all share the "STNDG ORDER - LOCAL" description) is split by amount, and each
+    stable amount is reported on its own as "<counterparty> (<amount>)". Card purchases are
+    not split, so repeat purchases of a similar amount are not mistaken for instalments.
+    """
+    recurring = _stable_recurring(partials, ["COUNTERPARTY"], min_months, max_variation)
+
+    # Counterparties not recurring as a whole may still carry several fixed payments
+    counterparties = partials.index.get_level_values("COUNTERPARTY")
+    is_card = partials.index.get_level_values("IS_CARD")
+    split = partials[~is_card & ~counterparties.isin(recurring.index)]
+    by_amount = _stable_recurring(split, ["COUNTERPARTY", "AMOUNT_BUCKET"], min_months, max_variation)
+    by_amount.index = [f"{counterparty} ({amount:,.0f})" for counterparty, amount in by_amount.index]
+
+    recurring = pd.concat([recurring, by_amount])
+    recurring.index = recurring.index.astype("object")
+    recurring.index.name = "COUNTERPARTY"
+    return recurring.rename(columns={"Typical_Amount": "Typical Amount", "Last_Payment": "Last Payment"}).sort_values("Months", ascending=False)
+
+
+def card_breakdown_from_partials(partials):
+    """Debit spend per card and channel."""
+    return partials.reset_index().groupby(["TXN_CARD", "TXN_CHANNEL"], observed=True).agg(
+        Transactions=("Transactions", "sum"),
+        Total_Spend=("Total Spend", "sum"),
+        Merchants=("MERCHANT", "nunique"),
+    ).rename(columns={"Total_Spend": "Total Spend"})
+
+
+# **Summaries of a whole (small) statement**
+def top_merchants(df, n=10):
+    """Debit spend per merchant, largest first."""
+    return top_merchants_from_partials(spend_partials(df), n)
+
+
+def recurring_payments(df, min_months=RECURRING_MIN_MONTHS, max_variation=RECURRING_MAX_AMOUNT_VARIATION):
+    """Debits to the same counterparty paid in several distinct months with a stable amount."""
+    return recurring_payments_from_partials(recurring_partials(df), min_months, max_variation)
+
+
+def card_breakdown(df):
+    """Debit spend per card and channel."""
+    return card_breakdown_from_partials(card_partials(df))
+
+
+def summarize_spending(merchants, recurring, limit=5):
+    """Plain-text summary of top merchants and recurring payments, for the LLM prompt."""
+    lines = ["- **Top Merchants by Spend:** " + (", ".join(
+        f"{merchant} (Rs {row['Total Spend']:.2f}, {int(row['Transactions'])} txns)"
+        for merchant, row in merchants.head(limit).iterrows()
+    ) or "None identified")]
+
+    lines.append("- **Recurring Payments:** " + (", ".join(
+        f"{payee} (~Rs {row['Typical Amount']:.2f} in {int(row['Months'])} months)"
+        for payee, row in recurring.head(limit).iterrows()
+    ) or "None identified"))
+    return "\n        ".join(lines)
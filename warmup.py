@@ -0,0 +1,125 @@
+import threading
+import time
+import cv2
+import numpy as np
+import requests
+from logger import logger
+from documents import InMemoryDocument
+from generate_embeddings import OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, ocr_image, run_ollama_model
+from llm_resilience import CircuitBreaker
+from profile_chat import OLLAMA_HOST
+
+# Seconds to wait for the model server to load the model into memory
+PRELOAD_TIMEOUT_SECONDS = 120
+
+
+def _warmup_image():
+    """Small synthetic page with a line of text, so detection and recognition both run."""
+    img = np.full((160, 640, 3), 255, dtype=np.uint8)
+    cv2.putText(img, "CUSTOMER PROFILER 2024", (20, 95), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+    return InMemoryDocument("warmup.png", cv2.imencode(".png", img)[1].tobytes())
+
+
+def warm_up_ocr():
+    """Loads the PaddleOCR models and runs one inference through the real preprocessing path.
+
+    Uses `ocr_image` rather than `extract_layout`, which would serve a cached result
+    without loading anything and whose callers swallow errors. Raises if the sample
+    text is not recognized, so a broken OCR setup is never reported ready.
+    """
+    pages = ocr_image(_warmup_image().decode_image())
+    if not any(page.lines for page in pages):
+        raise RuntimeError("OCR warm-up recognized no text in the sample image")
+
+
+def warm_up_llm():
+    """Loads the model with a long keep-alive, then runs a tiny generation through the CLI path.
+
+    The generation runs under its own circuit breaker: a server that is still starting
+    must not open the shared breaker and fail the first real requests fast.
+    """
+    try:
+        # A request without a prompt only loads the model and keeps it resident
+        requests.post(
+            f"{OLLAMA_HOST}/api/generate",
+            json={"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=PRELOAD_TIMEOUT_SECONDS,
+        ).raise_for_status()
+    except requests.RequestException as e:
+        # The CLI call below loads the model too; the HTTP API is only needed for the chat
+        logger.warning(f"Could not preload {OLLAMA_MODEL} over HTTP: {e}")
+
+    run_ollama_model("Reply with the single word OK.", circuit=CircuitBreaker())
+
+
+class Warmup:
+    """Runs the startup warm-up tasks on background threads and reports their readiness.
+
+    Each task has an event that is set when it finishes, successfully or not, so the UI
+    can wait on it with a cap instead of sleeping a fixed time.
+    """
+
+    TASKS = {
+        "ocr": warm_up_ocr,
+        "llm": warm_up_llm,
+    }
+
+    def __init__(self):
+        self.done = {name: threading.Event() for name in self.TASKS}
+        self.errors = {}
+        self.durations = {}
+
+    def start(self):
+        for name, task in self.TASKS.items():
+            threading.Thread(target=self._run, args=(name, task), name=f"warmup-{name}", daemon=True).start()
+        return self
+
+    def _run(self, name, task):
+        start = time.perf_counter()
+        try:
+            task()
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.error(f"Warm-up of {name} failed: {e}")
+        finally:
+            self.durations[name] = time.perf_counter() - start
+            logger.info(f"Warm-up of {name} finished in {self.durations[name]:.1f}s")
+            self.done[name].set()
+
+    @property
+    def finished(self):
+        return all(event.is_set() for event in self.done.values())
+
+    @property
+    def ready(self):
+        """True once every task finished without errors."""
+        return self.finished and not self.errors
+
+    def wait(self, timeout=None):
+        """Blocks until all tasks finish or `timeout` seconds pass; returns `finished`."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for event in self.done.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not event.wait(remaining):
+                return False
+        return True
+
+    def status(self):
+        """Per-task status: "warming", "ready" or "failed"."""
+        return {
+            name: "warming" if not event.is_set() else ("failed" if name in self.errors else "ready")
+            for name, event in self.done.items()
+        }
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def start_warmup():
+    """Starts the process-wide warm-up once; later calls return the same instance."""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = Warmup().start()
+        return _warmup